@@ -0,0 +1,66 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+import functools
+
+from . import crud
+
+
+def to_async(fn):
+    # The crud function as a coroutine. With an AsyncSession it runs on the
+    # session's asyncpg connection (inside a greenlet, so the queries do not
+    # block the event loop), with a sync Session it runs in the threadpool.
+    @functools.wraps(fn)
+    async def wrapper(db, *args, **kwargs):
+        if isinstance(db, AsyncSession):
+            return await db.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, db, *args, **kwargs)
+
+    return wrapper
+
+
+get_user = to_async(crud.get_user)
+get_user_by_email = to_async(crud.get_user_by_email)
+get_login = to_async(crud.get_login)
+get_users = to_async(crud.get_users)
+get_user_type = to_async(crud.get_user_type)
+create_user = to_async(crud.create_user)
+update_password_hash = to_async(crud.update_password_hash)
+get_user_carbon = to_async(crud.get_user_carbon)
+create_user_carbon = to_async(crud.create_user_carbon)
+reconcile_carbon_totals = to_async(crud.reconcile_carbon_totals)
+get_carbon_totals = to_async(crud.get_carbon_totals)
+get_all_carbon = to_async(crud.get_all_carbon)
+get_all_carbon_rows = to_async(crud.get_all_carbon_rows)
+get_news = to_async(crud.get_news)
+get_news_by_id = to_async(crud.get_news_by_id)
+news_exists = to_async(crud.news_exists)
+create_news = to_async(crud.create_news)
+get_boards = to_async(crud.get_boards)
+get_board_by_id = to_async(crud.get_board_by_id)
+create_board = to_async(crud.create_board)
+get_discussions_by_board_id = to_async(crud.get_discussions_by_board_id)
+create_discussion = to_async(crud.create_discussion)
+create_discussion_interaction = to_async(crud.create_discussion_interaction)
+get_cert_detail = to_async(crud.get_cert_detail)
+count_certs_by_date = to_async(crud.count_certs_by_date)
+upload_new_image = to_async(crud.upload_new_image)
+get_all_hotels = to_async(crud.get_all_hotels)
+get_cheapest_rooms = to_async(crud.get_cheapest_rooms)
+get_hotel_facets = to_async(crud.get_hotel_facets)
+get_info_by_room_id = to_async(crud.get_info_by_room_id)
+get_room = to_async(crud.get_room)
+get_available_rooms = to_async(crud.get_available_rooms)
+search_hotels = to_async(crud.search_hotels)
+get_bookings_by_user_id = to_async(crud.get_bookings_by_user_id)
+get_all_bookings = to_async(crud.get_all_bookings)
+book_room = to_async(crud.book_room)
+get_all_events = to_async(crud.get_all_events)
+get_event = to_async(crud.get_event)
+book_event = to_async(crud.book_event)
+get_all_event_bookings = to_async(crud.get_all_event_bookings)
+get_summary_hotel = to_async(crud.get_summary_hotel)
+get_summary_event = to_async(crud.get_summary_event)
+get_revenue_dashboard = to_async(crud.get_revenue_dashboard)
+get_user_booked_event = to_async(crud.get_user_booked_event)
+get_user_booked_hotel = to_async(crud.get_user_booked_hotel)
@@ -1,19 +1,151 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    Date,
+    DateTime,
+    and_,
+    case,
+    cast,
+    exists,
+    insert,
+    inspect,
+    literal,
+    literal_column,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
 from sqlalchemy.sql import func
 
-from app.utils.certificate import make_certificate
+import base64
+import binascii
+import json
+import os
+from datetime import date, datetime, timedelta
 
 from .db import models, schemas
 
-from .utils import authentication as auth
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "50"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "500"))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
 
 
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+def encode_cursor(values: list):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
 
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+class InvalidPage(ValueError):
+    pass
+
+
+class SoldOut(Exception):
+    pass
+
+
+def decode_cursor(cursor: str, keys):
+    # raises InvalidPage on anything that is not a cursor we handed out
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("Invalid cursor")
+        after = []
+        for key, value in zip(keys, values):
+            if isinstance(key.type, DateTime):
+                after.append(datetime.fromisoformat(value))
+            else:
+                after.append(key.type.python_type(value))
+        return after
+    except (binascii.Error, TypeError, ValueError):
+        raise InvalidPage("Invalid cursor")
+
+
+def project(query, fields: list):
+    # select only the named columns of the query's entity
+    entity = query.column_descriptions[0]["entity"]
+    columns = inspect(entity).column_attrs
+    names = list(dict.fromkeys(fields))
+    for name in names:
+        if name not in columns:
+            raise InvalidPage("Unknown field " + name)
+    return query.with_entities(*(getattr(entity, name) for name in names))
+
+
+def paginate(
+    query,
+    keys,
+    cursor: str = None,
+    limit: int = None,
+    fields: list = None,
+    schema=None,
+):
+    # Keyset pagination ordered by `keys` (a unique column tuple, normally
+    # (created_at, id) or the primary key). Returns (rows, next_cursor), where
+    # next_cursor is None on the last page. With `fields`, only those columns
+    # (plus the keys) are selected and rows are returned as dicts, otherwise
+    # the relationships `schema` serializes are eager loaded.
+    limit = PAGE_SIZE_DEFAULT if limit is None else min(limit, PAGE_SIZE_MAX)
+
+    if cursor is not None:
+        query = query.filter(tuple_(*keys) > tuple_(*decode_cursor(cursor, keys)))
+    query = query.order_by(*keys)
+
+    if fields is not None:
+        query = project(query, [*fields, *(key.key for key in keys)])
+    elif schema is not None:
+        query = query.options(*schemas.load_options(schema))
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            [
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in (getattr(last, key.key) for key in keys)
+            ]
+        )
+
+    if fields is not None:
+        rows = [row._asdict() for row in rows]
+    return rows, next_cursor
+
+
+def stream(query, keys, fields: list):
+    # Every row of the query in `keys` order as a dict of `fields`, read
+    # through a server-side cursor STREAM_BATCH_SIZE rows at a time so
+    # memory does not grow with the result. Fields are checked before the
+    # first row is read.
+    query = project(query, fields).order_by(*keys).yield_per(STREAM_BATCH_SIZE)
+    return (row._asdict() for row in query)
+
+
+def get_user(db: Session, user_id: int, eager: bool = False):
+    query = db.query(models.User)
+    if eager:
+        query = query.options(*schemas.load_options(schemas.User))
+    return query.filter(models.User.id == user_id).first()
+
+
+def get_user_by_email(db: Session, email: str, eager: bool = False):
+    query = db.query(models.User)
+    if eager:
+        query = query.options(*schemas.load_options(schemas.User))
+    return query.filter(models.User.email == email).first()
+
+
+def get_login(db: Session, email: str):
+    # id and password hash only, the transaction is ended so the connection
+    # goes back to the pool instead of waiting on bcrypt with the route
+    login = (
+        db.query(models.User.id, models.User.hashed_password)
+        .filter(models.User.email == email)
+        .first()
+    )
+    db.rollback()
+    return login
 
 
 def get_users(db: Session, skip: int = 0, limit: int = 100):
@@ -24,20 +156,21 @@ def get_user_type(db: Session):
     return db.query(models.UserType).all()
 
 
-def login_user(db: Session, email: str, password: str):
-    db_user = get_user_by_email(db, email=email)
-    if db_user is None:
-        return None
-    if not auth.verify_password(password, db_user.hashed_password):
-        return None
-    token = auth.get_access_token({"sub": db_user.id})
-    return {"access_token": token, "data": db_user}
+def load_relationships(db_obj, schema):
+    # Load what the response schema serializes while the session can still
+    # lazy load it, an AsyncSession cannot once the crud call has returned.
+    relationships = inspect(type(db_obj)).relationships
+    for name in schema.__fields__:
+        if name in relationships:
+            getattr(db_obj, name)
+    return db_obj
 
 
-def create_user(db: Session, user: schemas.UserCreate):
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
+    # hashing is left to the caller, it is too slow to run on the event loop
     db_user = models.User(
         email=user.email,
-        hashed_password=auth.get_password_hash(user.password),
+        hashed_password=hashed_password,
         name=user.name,
         lastname=user.lastname,
         mobile_phone=user.mobile_phone,
@@ -46,16 +179,49 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return db_user
+    return load_relationships(db_user, schemas.User)
 
 
-def get_user_carbon(db: Session, user_id: int):
-    return (
-        db.query(models.UserCarbon).filter(models.UserCarbon.user_id == user_id).all()
+def update_password_hash(db: Session, user_id: int, hashed_password: str):
+    # a hash made with the current bcrypt cost in place of an older one
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.hashed_password: hashed_password}, synchronize_session=False
+    )
+    db.commit()
+
+
+def get_user_carbon(
+    db: Session,
+    user_id: int,
+    cursor: str = None,
+    limit: int = None,
+    fields: list = None,
+):
+    return paginate(
+        db.query(models.UserCarbon).filter(models.UserCarbon.user_id == user_id),
+        (models.UserCarbon.created_at, models.UserCarbon.id),
+        cursor=cursor,
+        limit=limit,
+        fields=fields,
     )
 
 
+def stream_user_carbon(db: Session, user_id: int, fields: list):
+    return stream(
+        db.query(models.UserCarbon).filter(models.UserCarbon.user_id == user_id),
+        (models.UserCarbon.created_at, models.UserCarbon.id),
+        fields,
+    )
+
+
+CARBON_TOTAL_ID = 1
+
+
 def create_user_carbon(db: Session, user_carbon: schemas.UserCarbonCreate):
+    db_user = get_user(db, user_id=user_carbon.user_id)
+    if db_user is None:
+        return None
+
     db_user_carbon = models.UserCarbon(
         user_id=user_carbon.user_id,
         carbon_offset=user_carbon.carbon_offset,
@@ -63,88 +229,198 @@ def create_user_carbon(db: Session, user_carbon: schemas.UserCarbonCreate):
         fee=user_carbon.fee,
     )
     db.add(db_user_carbon)
-    db.commit()
-    db.refresh(db_user_carbon)
-
-    db_user = get_user(db, user_id=user_carbon.user_id)
     db_user.xp += 0.2 * user_carbon.donate_amount
+
+    # running totals are updated in the same transaction as the donation
+    updated = (
+        db.query(models.CarbonTotal)
+        .filter(models.CarbonTotal.id == CARBON_TOTAL_ID)
+        .update(
+            {
+                models.CarbonTotal.carbon_offset: models.CarbonTotal.carbon_offset
+                + user_carbon.carbon_offset,
+                models.CarbonTotal.donate_amount: models.CarbonTotal.donate_amount
+                + user_carbon.donate_amount,
+                models.CarbonTotal.fee: models.CarbonTotal.fee + user_carbon.fee,
+                models.CarbonTotal.donation_count: models.CarbonTotal.donation_count
+                + 1,
+            },
+            synchronize_session=False,
+        )
+    )
+    if updated == 0:
+        db.flush()
+        reconcile_carbon_totals(db, commit=False)
+
     db.commit()
-    db.refresh(db_user)
+    db.refresh(db_user_carbon)
 
     return db_user_carbon
 
 
+def reconcile_carbon_totals(db: Session, commit: bool = True):
+    # Lock the totals row before summing, so a donation committed after the
+    # sum was read waits and is added on top of the reconciled value.
+    db_total = (
+        db.query(models.CarbonTotal)
+        .filter(models.CarbonTotal.id == CARBON_TOTAL_ID)
+        .with_for_update()
+        .first()
+    )
+    if db_total is None:
+        db_total = models.CarbonTotal(id=CARBON_TOTAL_ID)
+        db.add(db_total)
+
+    totals = db.query(
+        func.coalesce(func.sum(models.UserCarbon.carbon_offset), 0),
+        func.coalesce(func.sum(models.UserCarbon.donate_amount), 0),
+        func.coalesce(func.sum(models.UserCarbon.fee), 0),
+        func.count(models.UserCarbon.id),
+    ).one()
+    (
+        db_total.carbon_offset,
+        db_total.donate_amount,
+        db_total.fee,
+        db_total.donation_count,
+    ) = totals
+    db_total.updated_at = func.now()
+
+    if commit:
+        db.commit()
+        db.refresh(db_total)
+    return db_total
+
+
+def get_carbon_totals(db: Session):
+    db_total = (
+        db.query(models.CarbonTotal)
+        .filter(models.CarbonTotal.id == CARBON_TOTAL_ID)
+        .first()
+    )
+    if db_total is None:
+        db_total = reconcile_carbon_totals(db)
+    return db_total
+
+
 def get_all_carbon(db: Session):
-    all_carbon = db.query(models.UserCarbon).all()
-    all_carbon_offset = sum([carbon.carbon_offset for carbon in all_carbon])
-    return {"all_carbon_offset": all_carbon_offset, "all_carbon": all_carbon}
+    db_total = get_carbon_totals(db)
+    return {
+        "all_carbon_offset": db_total.carbon_offset,
+        "all_donate_amount": db_total.donate_amount,
+        "all_fee": db_total.fee,
+        "donation_count": db_total.donation_count,
+        "updated_at": db_total.updated_at,
+    }
+
+
+def get_all_carbon_rows(
+    db: Session, cursor: str = None, limit: int = None, fields: list = None
+):
+    return paginate(
+        db.query(models.UserCarbon),
+        (models.UserCarbon.created_at, models.UserCarbon.id),
+        cursor=cursor,
+        limit=limit,
+        fields=fields,
+    )
 
 
-def get_news(db: Session):
-    return db.query(models.New).all()
+def stream_all_carbon_rows(db: Session, fields: list):
+    return stream(
+        db.query(models.UserCarbon),
+        (models.UserCarbon.created_at, models.UserCarbon.id),
+        fields,
+    )
+
+
+def get_news(db: Session, cursor: str = None, limit: int = None, fields: list = None):
+    return paginate(
+        db.query(models.New),
+        (models.New.created_at, models.New.id),
+        cursor=cursor,
+        limit=limit,
+        fields=fields,
+        schema=schemas.New,
+    )
 
 
 def get_news_by_id(db: Session, new_id: int):
     return db.query(models.New).filter(models.New.id == new_id).first()
 
 
-def create_news(db: Session, news: schemas.NewCreate):
-    new_owner = get_user(db, user_id=news.owner_id)
-    if new_owner is None:
-        return None
+def news_exists(db: Session, new_id: int):
+    # the transaction is ended so no connection is held while the caller
+    # receives an upload
+    exists = db.query(models.New.id).filter(models.New.id == new_id).first()
+    db.rollback()
+    return exists is not None
+
+
+def create_news(db: Session, news: schemas.NewCreate, owner_id: int):
     db_news = models.New(
         title=news.title,
         location=news.location,
         description=news.description,
         join_detail=news.join_detail,
-        owner_id=news.owner_id,
+        owner_id=owner_id,
     )
     db.add(db_news)
     db.commit()
     db.refresh(db_news)
-    return db_news
+    return load_relationships(db_news, schemas.New)
 
 
-def get_boards(db: Session):
-    return db.query(models.Board).all()
+def get_boards(db: Session, cursor: str = None, limit: int = None, fields: list = None):
+    return paginate(
+        db.query(models.Board),
+        (models.Board.created_at, models.Board.id),
+        cursor=cursor,
+        limit=limit,
+        fields=fields,
+        schema=schemas.Board,
+    )
 
 
 def get_board_by_id(db: Session, board_id: int):
-    return db.query(models.Board).filter(models.Board.id == board_id).first()
+    return (
+        db.query(models.Board)
+        .options(*schemas.load_options(schemas.Board))
+        .filter(models.Board.id == board_id)
+        .first()
+    )
 
 
-def create_board(db: Session, board: schemas.BoardCreate):
-    board_owner = get_user(db, user_id=board.owner_id)
-    if board_owner is None:
-        return None
+def create_board(db: Session, board: schemas.BoardCreate, owner_id: int):
     db_board = models.Board(
         title=board.title,
         body=board.body,
-        owner_id=board.owner_id,
+        owner_id=owner_id,
     )
     db.add(db_board)
     db.commit()
     db.refresh(db_board)
-    return db_board
+    return load_relationships(db_board, schemas.Board)
 
 
 def get_discussions_by_board_id(db: Session, board_id: int):
     return (
-        db.query(models.Discussion).filter(models.Discussion.board_id == board_id).all()
+        db.query(models.Discussion)
+        .options(*schemas.load_options(schemas.Discussion))
+        .filter(models.Discussion.board_id == board_id)
+        .all()
     )
 
 
-def create_discussion(db: Session, board_id: int, discussion: schemas.DiscussionCreate):
-    discussion_owner = get_user(db, user_id=discussion.owner_id)
-    if discussion_owner is None:
-        return None
+def create_discussion(
+    db: Session, board_id: int, discussion: schemas.DiscussionCreate, owner_id: int
+):
     db_discussion = models.Discussion(
-        body=discussion.body, owner_id=discussion.owner_id, board_id=board_id
+        body=discussion.body, owner_id=owner_id, board_id=board_id
     )
     db.add(db_discussion)
     db.commit()
     db.refresh(db_discussion)
-    return db_discussion
+    return load_relationships(db_discussion, schemas.Discussion)
 
 
 def create_discussion_interaction(
@@ -152,44 +428,95 @@ def create_discussion_interaction(
     discussion_id: int,
     discussion_interaction: schemas.DiscussionInteractionCreate,
 ):
-    discussion_interaction_owner = get_user(db, user_id=discussion_interaction.user_id)
-    if discussion_interaction_owner is None:
-        return None
+    # One statement: upsert the user's interaction and, when it was added or
+    # switched between like and dislike, move the discussion's counters. A
+    # repeated click matches the existing row and changes nothing. Returns
+    # None for an unknown user or discussion.
+    interaction = models.DiscussionInteraction
+    upsert = pg_insert(interaction).values(
+        user_id=discussion_interaction.user_id,
+        discussion_id=discussion_id,
+        interaction_type=discussion_interaction.interaction_type,
+    )
+    upsert = (
+        upsert.on_conflict_do_update(
+            constraint="uq_discussion_interactions_discussion_id_user_id",
+            set_={"interaction_type": upsert.excluded.interaction_type},
+            where=interaction.interaction_type.is_distinct_from(
+                upsert.excluded.interaction_type
+            ),
+        )
+        .returning(
+            *interaction.__table__.columns,
+            # xmax is 0 for a row this statement inserted
+            literal_column("xmax = 0").label("inserted"),
+        )
+        .cte("upsert")
+    )
 
-    # check if user ever interacted with this discussion
-    db_discussion_interaction = (
-        db.query(models.DiscussionInteraction)
-        .filter(
-            models.DiscussionInteraction.user_id == discussion_interaction.user_id,
-            models.DiscussionInteraction.discussion_id == discussion_id,
+    def counter_change(interaction_type: str):
+        return case(
+            (upsert.c.interaction_type == interaction_type, 1),
+            (upsert.c.inserted, 0),
+            else_=-1,
         )
-        .first()
+
+    columns = (
+        upsert.c.id,
+        upsert.c.discussion_id,
+        upsert.c.user_id,
+        upsert.c.interaction_type,
+        upsert.c.created_at,
     )
+    try:
+        result = db.execute(
+            update(models.Discussion)
+            .where(models.Discussion.id == upsert.c.discussion_id)
+            .values(
+                like_count=models.Discussion.like_count + counter_change("like"),
+                dislike_count=models.Discussion.dislike_count
+                + counter_change("dislike"),
+            )
+            .returning(
+                *columns,
+                models.Discussion.like_count,
+                models.Discussion.dislike_count,
+            )
+            .execution_options(synchronize_session=False)
+        ).first()
+    except IntegrityError:
+        db.rollback()
+        return None
+    db.commit()
+    if result is not None:
+        return result
 
-    if db_discussion_interaction is None:
-        db_discussion_interaction = models.DiscussionInteraction(
-            user_id=discussion_interaction.user_id,
-            discussion_id=discussion_id,
-            interaction_type=discussion_interaction.interaction_type,
+    # the same interaction again
+    return (
+        db.query(
+            *interaction.__table__.columns,
+            models.Discussion.like_count,
+            models.Discussion.dislike_count,
         )
-        db.add(db_discussion_interaction)
-        db.commit()
-        db.refresh(db_discussion_interaction)
-        return db_discussion_interaction
-    else:
-        db_discussion_interaction.interaction_type = (
-            discussion_interaction.interaction_type
+        .join(models.Discussion, models.Discussion.id == interaction.discussion_id)
+        .filter(
+            interaction.discussion_id == discussion_id,
+            interaction.user_id == discussion_interaction.user_id,
         )
-        db.commit()
-        db.refresh(db_discussion_interaction)
-        return db_discussion_interaction
+        .first()
+    )
 
 
-def get_certificate(name: str, co2_amount: str, date: str, cert_id: str):
-    return make_certificate(name, co2_amount, date, cert_id)
+def cert_detail(user_carbon: models.UserCarbon, user: models.User):
+    return {
+        "name": user.name + " " + user.lastname,
+        "co2_amount": str(user_carbon.carbon_offset),
+        "date": str(user_carbon.created_at.strftime("%d/%m/%Y")),
+        "cert_id": "RCC" + str(user_carbon.id).zfill(10),
+    }
 
 
-def get_cert_by_carbon_id(db: Session, carbon_id: int):
+def get_cert_detail(db: Session, carbon_id: int):
     detail = (
         db.query(models.UserCarbon, models.User)
         .join(models.User, models.UserCarbon.user_id == models.User.id)
@@ -198,18 +525,38 @@ def get_cert_by_carbon_id(db: Session, carbon_id: int):
     )
     if detail is None:
         return None
-    cert = get_certificate(
-        name=detail.User.name + " " + detail.User.lastname,
-        co2_amount=str(detail.UserCarbon.carbon_offset),
-        date=str(detail.UserCarbon.created_at.strftime("%d/%m/%Y")),
-        cert_id="RCC" + str(detail.UserCarbon.id).zfill(10),
+    return cert_detail(detail.UserCarbon, detail.User)
+
+
+def count_certs_by_date(db: Session, start: date, end: date):
+    return (
+        db.query(func.count(models.UserCarbon.id))
+        .filter(
+            models.UserCarbon.created_at >= start,
+            models.UserCarbon.created_at < end + timedelta(days=1),
+        )
+        .scalar()
     )
 
-    return cert
+
+def get_certs_by_date(db: Session, start: date, end: date):
+    # issued between start and end (both inclusive), fetched in batches
+    details = (
+        db.query(models.UserCarbon, models.User)
+        .join(models.User, models.UserCarbon.user_id == models.User.id)
+        .filter(
+            models.UserCarbon.created_at >= start,
+            models.UserCarbon.created_at < end + timedelta(days=1),
+        )
+        .order_by(models.UserCarbon.id)
+        .yield_per(500)
+    )
+    for detail in details:
+        yield detail.UserCarbon, cert_detail(detail.UserCarbon, detail.User)
 
 
-def upload_new_image(db: Session, new_id: int, image_path: str):
-    db_new_image = models.NewImage(image=image_path + ".jpg", new_id=new_id)
+def upload_new_image(db: Session, new_id: int, image: str):
+    db_new_image = models.NewImage(image=image, new_id=new_id)
     db.add(db_new_image)
     db.commit()
     db.refresh(db_new_image)
@@ -217,17 +564,111 @@ def upload_new_image(db: Session, new_id: int, image_path: str):
     return db_new_image
 
 
-def get_all_hotels(db: Session):
-    return db.query(models.Hotel).all()
+def hotel_filters(
+    stars: list = None,
+    min_rating: int = None,
+    city: str = None,
+    country: str = None,
+    facilities: list = None,
+):
+    # a hotel has to match every filter given and have all the facilities
+    filters = []
+    if stars:
+        filters.append(models.Hotel.stars.in_(stars))
+    if min_rating is not None:
+        filters.append(models.Hotel.rating >= min_rating)
+    if city is not None:
+        filters.append(models.Hotel.city == city)
+    if country is not None:
+        filters.append(models.Hotel.country == country)
+    for facility_id in facilities or ():
+        filters.append(
+            exists().where(
+                models.HotelFacility.hotel_id == models.Hotel.hotel_id,
+                models.HotelFacility.facility_id == facility_id,
+            )
+        )
+    return filters
 
 
-def get_cheapest_rooms(db: Session):
-    return (
-        db.query(models.Room, models.Hotel)
-        .join(models.Hotel, models.Room.hotel_id == models.Hotel.hotel_id)
-        .order_by(models.Room.price_per_night)
+def get_all_hotels(
+    db: Session,
+    cursor: str = None,
+    limit: int = None,
+    **filters,
+):
+    return paginate(
+        db.query(models.Hotel).filter(*hotel_filters(**filters)),
+        (models.Hotel.hotel_id,),
+        cursor=cursor,
+        limit=limit,
+        schema=schemas.Hotel,
+    )
+
+
+def get_cheapest_rooms(db: Session, hotel_ids: list):
+    # the cheapest room of each hotel, ranked per hotel on
+    # ix_rooms_hotel_id_price instead of sorting every room
+    rank = (
+        func.row_number()
+        .over(
+            partition_by=models.Room.hotel_id,
+            order_by=(models.Room.price_per_night, models.Room.room_id),
+        )
+        .label("rank")
+    )
+    ranked = (
+        select(models.Room, rank).where(models.Room.hotel_id.in_(hotel_ids)).subquery()
+    )
+    room = aliased(models.Room, ranked)
+    rooms = db.query(room).filter(ranked.c.rank == 1)
+    return {room.hotel_id: room for room in rooms}
+
+
+def get_hotel_facets(db: Session, **filters):
+    # hotel counts per stars, city, country and facility among the hotels
+    # matching the filters, plus the total
+    filters = hotel_filters(**filters)
+    grouped = (models.Hotel.stars, models.Hotel.city, models.Hotel.country)
+    rows = (
+        db.query(
+            *grouped,
+            *(func.grouping(column) for column in grouped),
+            func.count(),
+        )
+        .filter(*filters)
+        .group_by(func.grouping_sets(*grouped, tuple_()))
+        .order_by(func.count().desc())
         .all()
     )
+    facets = {"total": 0, "stars": {}, "city": {}, "country": {}}
+    for *values, count in rows:
+        keys, grouping = values[: len(grouped)], values[len(grouped) :]
+        if all(grouping):
+            facets["total"] = count
+            continue
+        for column, key, grouped_out in zip(grouped, keys, grouping):
+            if not grouped_out and key is not None:
+                facets[column.key][key] = count
+
+    facets["facilities"] = [
+        {"facility_id": facility_id, "name": name, "count": count}
+        for facility_id, name, count in db.query(
+            models.Facility.facility_id, models.Facility.name, func.count()
+        )
+        .join(
+            models.HotelFacility,
+            models.HotelFacility.facility_id == models.Facility.facility_id,
+        )
+        .filter(
+            models.HotelFacility.hotel_id.in_(
+                select(models.Hotel.hotel_id).where(*filters)
+            )
+        )
+        .group_by(models.Facility.facility_id)
+        .order_by(func.count().desc(), models.Facility.facility_id)
+    ]
+    return facets
 
 
 def get_info_by_room_id(db: Session, room_id: int):
@@ -240,21 +681,175 @@ def get_info_by_room_id(db: Session, room_id: int):
     )
 
 
-def get_available_rooms(db: Session, hotel_id: int):
-    return db.query(models.Room).filter(models.Room.hotel_id == hotel_id).all()
+def get_room(db: Session, room_id: int):
+    return db.query(models.Room).filter(models.Room.room_id == room_id).first()
+
+
+def room_free(check_in: date, check_out: date):
+    # rooms with at least one room of the type left on every night of the
+    # stay, probes the room_inventory primary key for the nights
+    return and_(
+        models.Room.availability > 0,
+        ~exists().where(
+            models.RoomInventory.room_id == models.Room.room_id,
+            models.RoomInventory.night >= check_in,
+            models.RoomInventory.night < check_out,
+            models.RoomInventory.booked >= models.Room.availability,
+        ),
+    )
+
+
+def get_available_rooms(
+    db: Session, hotel_id: int, check_in: date = None, check_out: date = None
+):
+    query = db.query(models.Room).filter(models.Room.hotel_id == hotel_id)
+    if check_in is not None and check_out is not None:
+        query = query.filter(room_free(check_in, check_out))
+    return query.all()
+
+
+def search_hotels(
+    db: Session,
+    city: str,
+    check_in: date,
+    check_out: date,
+    min_price: int = None,
+    max_price: int = None,
+    cursor: str = None,
+    limit: int = None,
+):
+    # hotels in `city` with a room free for the whole stay within the price
+    # range, each with those rooms cheapest first
+    room_filters = [room_free(check_in, check_out)]
+    if min_price is not None:
+        room_filters.append(models.Room.price_per_night >= min_price)
+    if max_price is not None:
+        room_filters.append(models.Room.price_per_night <= max_price)
+
+    hotels, next_cursor = paginate(
+        db.query(models.Hotel).filter(
+            models.Hotel.city == city,
+            exists().where(
+                models.Room.hotel_id == models.Hotel.hotel_id, *room_filters
+            ),
+        ),
+        (models.Hotel.hotel_id,),
+        cursor=cursor,
+        limit=limit,
+        schema=schemas.Hotel,
+    )
+
+    rooms = {hotel.hotel_id: [] for hotel in hotels}
+    for room in (
+        db.query(models.Room)
+        .filter(models.Room.hotel_id.in_(rooms), *room_filters)
+        .order_by(models.Room.price_per_night, models.Room.room_id)
+    ):
+        rooms[room.hotel_id].append(room)
+
+    results = [{"hotel": hotel, "rooms": rooms[hotel.hotel_id]} for hotel in hotels]
+    return results, next_cursor
 
 
 def get_bookings_by_user_id(db: Session, user_id: int):
     return db.query(models.Booking).filter(models.Booking.user_id == user_id).all()
 
 
-def get_all_bookings(db: Session):
-    return db.query(models.Booking).all()
+def get_all_bookings(
+    db: Session, cursor: str = None, limit: int = None, fields: list = None
+):
+    return paginate(
+        db.query(models.Booking),
+        (models.Booking.booking_id,),
+        cursor=cursor,
+        limit=limit,
+        fields=fields,
+    )
+
+
+def stream_all_bookings(db: Session, fields: list):
+    return stream(db.query(models.Booking), (models.Booking.booking_id,), fields)
+
+
+def stay_nights(check_in, check_out):
+    # set returning expression with one date per night from check_in up to
+    # the night before check_out
+    return cast(
+        func.generate_series(
+            cast(check_in, Date),
+            cast(check_out, Date) - 1,
+            text("interval '1 day'"),
+        ),
+        Date,
+    )
+
+
+def upsert_revenue(model, columns: list, rows):
+    # add the revenue rows selected by `rows` on top of the summary rows
+    # with the same key
+    keys = [column.name for column in model.__table__.primary_key]
+    statement = pg_insert(model).from_select(columns, rows)
+    return statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={
+            name: getattr(model, name) + getattr(statement.excluded, name)
+            for name in columns
+            if name not in keys
+        },
+    )
 
 
-def book_room(db: Session, booking: schemas.BookingCreate):
+def book_room(db: Session, booking: schemas.BookingCreate, user_id: int):
+    # Take one room of the type for every night of the stay and insert the
+    # booking in the same transaction. The nights are taken by a single
+    # upsert that only counts a night while rooms are left, so concurrent
+    # bookings cannot oversell it. Raises SoldOut when a night is full.
+    check_in = booking.check_in_date.date()
+    check_out = booking.check_out_date.date()
+    nights = (check_out - check_in).days
+
+    stay = select(
+        models.Room.room_id,
+        stay_nights(literal(check_in), literal(check_out)),
+        literal(1),
+    ).where(models.Room.room_id == booking.room_id, models.Room.availability > 0)
+    rooms_of_type = (
+        select(models.Room.availability)
+        .where(models.Room.room_id == booking.room_id)
+        .scalar_subquery()
+    )
+    taken = db.execute(
+        pg_insert(models.RoomInventory)
+        .from_select(["room_id", "night", "booked"], stay)
+        .on_conflict_do_update(
+            index_elements=[models.RoomInventory.room_id, models.RoomInventory.night],
+            set_={"booked": models.RoomInventory.booked + 1},
+            where=models.RoomInventory.booked < rooms_of_type,
+        )
+        .returning(models.RoomInventory.night)
+    ).all()
+    if len(taken) < nights:
+        db.rollback()
+        if get_room(db, booking.room_id) is None:
+            return None
+        raise SoldOut("Room is sold out")
+
+    revenue = select(
+        models.Room.hotel_id,
+        stay_nights(literal(check_in), literal(check_out)),
+        func.coalesce(models.Room.price_per_night, 0),
+        literal(1),
+    ).where(models.Room.room_id == booking.room_id)
+    db.execute(
+        upsert_revenue(
+            models.HotelRevenue,
+            ["hotel_id", "day", "revenue", "room_nights"],
+            revenue,
+        )
+    )
+
     db_booking = models.Booking(
-        user_id=booking.user_id,
+        user_id=user_id,
         room_id=booking.room_id,
         check_in_date=booking.check_in_date,
         check_out_date=booking.check_out_date,
@@ -265,78 +860,234 @@ def book_room(db: Session, booking: schemas.BookingCreate):
     db.commit()
     db.refresh(db_booking)
 
-    if db_booking is None:
-        return None
+    return db_booking
+
 
-    # update room availability
-    db_room = (
-        db.query(models.Room).filter(models.Room.room_id == booking.room_id).first()
+def get_all_events(
+    db: Session, cursor: str = None, limit: int = None, fields: list = None
+):
+    return paginate(
+        db.query(models.Event),
+        (models.Event.event_id,),
+        cursor=cursor,
+        limit=limit,
+        fields=fields,
     )
-    db_room.availability -= 1
-    db.commit()
-    db.refresh(db_room)
 
-    return db_booking
 
+def get_event(db: Session, event_id: int):
+    return db.query(models.Event).filter(models.Event.event_id == event_id).first()
 
-def get_all_events(db: Session):
-    return db.query(models.Event).all()
 
+def event_day(booked_at):
+    # the day an event's ticket revenue is counted on, events without a
+    # start date count on the day the ticket was booked
+    return cast(func.coalesce(models.Event.start_date, booked_at), Date)
 
-def book_event(db: Session, booking: schemas.EventBookingCreate):
-    bookArr = []
-    for i in range(booking.amount):
-        db_booking = models.EventBooking(
-            user_id=booking.user_id,
-            event_id=booking.event_id,
-            guest_name=booking.guest_name,
-            guest_email=booking.guest_email,
+
+def book_event(db: Session, booking: schemas.EventBookingCreate, user_id: int):
+    # All tickets or none: the capacity check and decrement is one
+    # conditional UPDATE and the tickets are one multi-row INSERT, committed
+    # together. Raises SoldOut when fewer than `amount` tickets are left.
+    taken = db.execute(
+        update(models.Event)
+        .where(
+            models.Event.event_id == booking.event_id,
+            models.Event.availability >= booking.amount,
         )
-        db.add(db_booking)
-        db.commit()
-        db.refresh(db_booking)
-        bookArr.append(db_booking)
+        .values(availability=models.Event.availability - booking.amount)
+        .returning(models.Event.event_id)
+    ).first()
+    if taken is None:
+        db.rollback()
+        if get_event(db, booking.event_id) is None:
+            return None
+        raise SoldOut("Not enough tickets left")
+
+    db.execute(
+        upsert_revenue(
+            models.EventRevenue,
+            ["event_id", "day", "revenue", "tickets"],
+            select(
+                models.Event.event_id,
+                # now() is the transaction start, the created_at of the tickets
+                event_day(func.now()),
+                func.coalesce(models.Event.price, 0) * booking.amount,
+                literal(booking.amount),
+            ).where(models.Event.event_id == booking.event_id),
+        )
+    )
+
+    ticket = {
+        "user_id": user_id,
+        "event_id": booking.event_id,
+        "guest_name": booking.guest_name,
+        "guest_email": booking.guest_email,
+    }
+    tickets = db.execute(
+        insert(models.EventBooking)
+        .values([ticket] * booking.amount)
+        .returning(*models.EventBooking.__table__.columns)
+    ).all()
+    db.commit()
+
+    return tickets
+
+
+def get_all_event_bookings(
+    db: Session, cursor: str = None, limit: int = None, fields: list = None
+):
+    return paginate(
+        db.query(models.EventBooking),
+        (models.EventBooking.booking_id,),
+        cursor=cursor,
+        limit=limit,
+        fields=fields,
+    )
 
-    if bookArr is None:
-        return None
 
-    # update event availability
-    db_event = (
-        db.query(models.Event).filter(models.Event.event_id == booking.event_id).first()
+def stream_all_event_bookings(db: Session, fields: list):
+    return stream(
+        db.query(models.EventBooking), (models.EventBooking.booking_id,), fields
     )
-    db_event.availability -= booking.amount
-    db.commit()
-    db.refresh(db_event)
 
-    return bookArr
+
+def rebuild_revenue_summaries(db: Session):
+    # Recompute the revenue summaries from the bookings. The summary tables
+    # are locked first, so bookings committing meanwhile wait and are added
+    # on top of the rebuilt rows.
+    db.execute(
+        text("LOCK TABLE hotel_revenue_daily, event_revenue_daily IN EXCLUSIVE MODE")
+    )
+    db.query(models.HotelRevenue).delete(synchronize_session=False)
+    db.query(models.EventRevenue).delete(synchronize_session=False)
+
+    nights = (
+        select(
+            models.Room.hotel_id,
+            stay_nights(
+                models.Booking.check_in_date, models.Booking.check_out_date
+            ).label("day"),
+            func.coalesce(models.Room.price_per_night, 0).label("price_per_night"),
+        )
+        .join(models.Booking, models.Booking.room_id == models.Room.room_id)
+        .subquery()
+    )
+    db.execute(
+        insert(models.HotelRevenue).from_select(
+            ["hotel_id", "day", "revenue", "room_nights"],
+            select(
+                nights.c.hotel_id,
+                nights.c.day,
+                func.sum(nights.c.price_per_night),
+                func.count(),
+            ).group_by(nights.c.hotel_id, nights.c.day),
+        )
+    )
+    day = event_day(models.EventBooking.created_at)
+    db.execute(
+        insert(models.EventRevenue).from_select(
+            ["event_id", "day", "revenue", "tickets"],
+            select(
+                models.Event.event_id,
+                day,
+                func.coalesce(models.Event.price, 0) * func.count(),
+                func.count(),
+            )
+            .join(
+                models.EventBooking,
+                models.EventBooking.event_id == models.Event.event_id,
+            )
+            .group_by(models.Event.event_id, day),
+        )
+    )
+    db.commit()
 
 
-def get_all_event_bookings(db: Session):
-    return db.query(models.EventBooking).all()
+def revenue_summaries_empty(db: Session):
+    return (
+        db.query(models.HotelRevenue).first() is None
+        and db.query(models.EventRevenue).first() is None
+    )
 
 
 def get_summary_hotel(db: Session, hotel_id: int):
-    # get sum of all bookings for a hotel
-    total_bookings = (
-        db.query(func.sum(models.Room.price_per_night))
-        .join(models.Booking, models.Room.room_id == models.Booking.room_id)
-        .filter(models.Room.hotel_id == hotel_id)
+    # income of all nights booked at a hotel
+    return (
+        db.query(func.sum(models.HotelRevenue.revenue))
+        .filter(models.HotelRevenue.hotel_id == hotel_id)
         .scalar()
     )
-    return total_bookings
 
 
 def get_summary_event(db: Session, event_id: int):
-    # get sum of all bookings for a hotel
-    total_bookings = (
-        db.query(func.sum(models.Event.price))
-        .join(
-            models.EventBooking, models.Event.event_id == models.EventBooking.event_id
-        )
-        .filter(models.Event.event_id == event_id)
+    # income of all tickets booked for an event
+    return (
+        db.query(func.sum(models.EventRevenue.revenue))
+        .filter(models.EventRevenue.event_id == event_id)
         .scalar()
     )
-    return total_bookings
+
+
+REVENUE_BUCKETS = ("day", "week", "month")
+
+
+def revenue_series(db: Session, model, count, start, end, bucket, filters):
+    bucket_start = cast(
+        func.date_trunc(literal_column(f"'{bucket}'"), model.day), Date
+    ).label("bucket_start")
+    return [
+        row._asdict()
+        for row in db.query(
+            bucket_start,
+            func.sum(model.revenue).label("revenue"),
+            func.sum(count).label(count.key),
+        )
+        .filter(model.day >= start, model.day < end, *filters)
+        .group_by(bucket_start)
+        .order_by(bucket_start)
+    ]
+
+
+def get_revenue_dashboard(
+    db: Session,
+    start: date,
+    end: date,
+    bucket: str = "day",
+    hotel_id: int = None,
+    event_id: int = None,
+):
+    # hotel and event revenue per day, week or month from start up to end,
+    # read from the summaries only
+    if bucket not in REVENUE_BUCKETS:
+        raise InvalidPage("Unknown bucket " + bucket)
+    hotel_filters = []
+    if hotel_id is not None:
+        hotel_filters.append(models.HotelRevenue.hotel_id == hotel_id)
+    event_filters = []
+    if event_id is not None:
+        event_filters.append(models.EventRevenue.event_id == event_id)
+    return {
+        "bucket": bucket,
+        "hotels": revenue_series(
+            db,
+            models.HotelRevenue,
+            models.HotelRevenue.room_nights,
+            start,
+            end,
+            bucket,
+            hotel_filters,
+        ),
+        "events": revenue_series(
+            db,
+            models.EventRevenue,
+            models.EventRevenue.tickets,
+            start,
+            end,
+            bucket,
+            event_filters,
+        ),
+    }
 
 
 def get_user_booked_event(db: Session, user_id: int):
@@ -1,11 +1,123 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import os
+import time
+
+from ..utils.config import env_flag
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds, -1 disables
+DB_POOL_PRE_PING = env_flag("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 disables
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "carbon-zero-backend")
+
+# route handlers use AsyncSession (asyncpg) instead of the sync engine
+DB_ASYNC = env_flag("DB_ASYNC")
+
+
+class TimedPoolMixin:
+    # counts checkouts, timeouts and time spent waiting for (or opening) a
+    # connection
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.checkouts += 1
+            self.wait_seconds += time.perf_counter() - start
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options():
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def make_engine(url: str = SQLALCHEMY_DATABASE_URL, **overrides):
+    connect_args = {"application_name": DB_APPLICATION_NAME}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
+    options = {
+        "poolclass": TimedQueuePool,
+        "connect_args": connect_args,
+        **pool_options(),
+    }
+    options.update(overrides)
+    return create_engine(url, **options)
+
+
+def make_async_engine(url: str = SQLALCHEMY_DATABASE_URL, **overrides):
+    # postgresql://... (psycopg2) -> postgresql+asyncpg://...
+    url = "postgresql+asyncpg://" + url.split("://", 1)[1]
+    server_settings = {"application_name": DB_APPLICATION_NAME}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+
+    options = {
+        "poolclass": TimedAsyncAdaptedQueuePool,
+        "connect_args": {"server_settings": server_settings},
+        **pool_options(),
+    }
+    options.update(overrides)
+    return create_async_engine(url, **options)
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts": pool.checkouts,
+        "timeouts": pool.timeouts,
+        "wait_seconds": pool.wait_seconds,
+    }
+
+
+# objects outlive the commit in both modes: an AsyncSession cannot reload
+# expired attributes while the response is serialized, and a Session would
+# query again for every object a route returns after committing
+engine = make_engine()
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+
+async_engine = make_async_engine() if DB_ASYNC else None
+AsyncSessionLocal = sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
 
 Base = declarative_base()
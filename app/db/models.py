@@ -1,7 +1,19 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
+from ..utils import image_urls
 from .database import Base
 
 
@@ -57,6 +69,28 @@ class UserCarbon(Base):
 
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
+    # all donations and a user's donations in the (created_at, id) page order
+    __table_args__ = (
+        Index("ix_user_carbon_created_at", created_at, id),
+        Index("ix_user_carbon_user_id_created_at", user_id, created_at, id),
+    )
+
+
+class CarbonTotal(Base):
+    __tablename__ = "carbon_totals"
+
+    # single row, kept up to date by every donation
+    id = Column(Integer, primary_key=True)
+
+    carbon_offset = Column(Float, nullable=False, default=0)
+    donate_amount = Column(Float, nullable=False, default=0)
+    fee = Column(Float, nullable=False, default=0)
+    donation_count = Column(Integer, nullable=False, default=0)
+
+    updated_at = Column(
+        DateTime, server_default=func.now(), onupdate=func.now(), nullable=False
+    )
+
 
 class New(Base):
     __tablename__ = "news"
@@ -74,6 +108,8 @@ class New(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="news")
 
+    __table_args__ = (Index("ix_news_created_at", created_at, id),)
+
 
 class NewImage(Base):
     __tablename__ = "new_images"
@@ -81,11 +117,16 @@ class NewImage(Base):
     id = Column(Integer, primary_key=True, index=True)
     image = Column(String)
 
-    new_id = Column(Integer, ForeignKey("news.id"))
+    new_id = Column(Integer, ForeignKey("news.id"), index=True)
     new = relationship("New", back_populates="images")
 
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
+    @property
+    def thumbnails(self):
+        # resized copies made when the image was uploaded
+        return image_urls.thumbnails(self.image)
+
 
 class Board(Base):
     __tablename__ = "boards"
@@ -101,6 +142,8 @@ class Board(Base):
 
     discussions = relationship("Discussion", back_populates="board")
 
+    __table_args__ = (Index("ix_boards_created_at", created_at, id),)
+
 
 class Discussion(Base):
     __tablename__ = "discussions"
@@ -109,9 +152,12 @@ class Discussion(Base):
     body = Column(String)
 
     owner_id = Column(Integer, ForeignKey("users.id"))
-    board_id = Column(Integer, ForeignKey("boards.id"))
+    board_id = Column(Integer, ForeignKey("boards.id"), index=True)
 
     details = relationship("DiscussionInteraction", back_populates="discussion")
+    # kept up to date by every interaction
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
+    dislike_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
@@ -133,6 +179,16 @@ class DiscussionInteraction(Base):
     owner = relationship("User", back_populates="discussion_interactions")
     discussion = relationship("Discussion", back_populates="details")
 
+    # one interaction per user and discussion, discussion first so loading a
+    # discussion's interactions uses it too
+    __table_args__ = (
+        UniqueConstraint(
+            discussion_id,
+            user_id,
+            name="uq_discussion_interactions_discussion_id_user_id",
+        ),
+    )
+
 
 class Hotel(Base):
     __tablename__ = "hotels"
@@ -142,7 +198,7 @@ class Hotel(Base):
     stars = Column(Integer)
     rating = Column(Integer)
     address = Column(String)
-    city = Column(String)
+    city = Column(String, index=True)
     country = Column(String)
     description = Column(String)
 
@@ -172,15 +228,39 @@ class Room(Base):
     hotel_id = Column(Integer, ForeignKey("hotels.hotel_id"))
     room_type = Column(String)
     price_per_night = Column(Integer)
+    # rooms of this type, the free rooms per night are in room_inventory
     availability = Column(Integer)
 
+    __table_args__ = (Index("ix_rooms_hotel_id_price", hotel_id, price_per_night),)
+
+
+class RoomInventory(Base):
+    __tablename__ = "room_inventory"
+
+    # one row per room type and night that has bookings, a missing row means
+    # nothing is booked that night
+    room_id = Column(Integer, ForeignKey("rooms.room_id"), primary_key=True)
+    night = Column(Date, primary_key=True)
+    booked = Column(Integer, nullable=False, default=0)
+
+
+class HotelRevenue(Base):
+    __tablename__ = "hotel_revenue_daily"
+
+    # revenue of the nights stayed at a hotel, one row per hotel and night,
+    # kept up to date by every booking
+    hotel_id = Column(Integer, ForeignKey("hotels.hotel_id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    revenue = Column(Integer, nullable=False, default=0)
+    room_nights = Column(Integer, nullable=False, default=0)
+
 
 class Booking(Base):
     __tablename__ = "bookings"
 
     booking_id = Column(Integer, primary_key=True)
-    room_id = Column(Integer, ForeignKey("rooms.room_id"))
-    user_id = Column(Integer, ForeignKey("users.id"))
+    room_id = Column(Integer, ForeignKey("rooms.room_id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     check_in_date = Column(DateTime)
     check_out_date = Column(DateTime)
     guest_name = Column(String)
@@ -208,13 +288,25 @@ class Event(Base):
     availability = Column(Integer)
 
 
+class EventRevenue(Base):
+    __tablename__ = "event_revenue_daily"
+
+    # ticket revenue of an event on the day it starts (or, without a start
+    # date, the day a ticket was booked), kept up to date by every event booking
+    event_id = Column(Integer, ForeignKey("events.event_id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    revenue = Column(Integer, nullable=False, default=0)
+    tickets = Column(Integer, nullable=False, default=0)
+
+
 class EventBooking(Base):
     __tablename__ = "event_bookings"
 
     booking_id = Column(Integer, primary_key=True)
-    event_id = Column(Integer, ForeignKey("events.event_id"))
-    user_id = Column(Integer, ForeignKey("users.id"))
+    event_id = Column(Integer, ForeignKey("events.event_id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     guest_name = Column(String)
     guest_email = Column(String)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
     owner = relationship("User", back_populates="event_booking")
@@ -1,6 +1,15 @@
-from pydantic import BaseModel
-from datetime import datetime
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import selectinload
+from datetime import date, datetime
+from typing import Dict, List, Literal, Optional
+
+from . import models
+
+
+def load_options(schema):
+    # loader options for the relationships a response schema serializes, so
+    # they are fetched in one extra query per page instead of one per row
+    return getattr(schema.__config__, "load_options", ())
 
 
 class User(BaseModel):
@@ -18,6 +27,7 @@ class User(BaseModel):
     class Config:
         underscore_attrs_are_private = True
         orm_mode = True
+        load_options = (selectinload(models.User.user_carbon),)
 
 
 class UserCreate(BaseModel):
@@ -59,15 +69,17 @@ class UserCarbonCreate(BaseModel):
         orm_mode = True
 
 
-class New(BaseModel):
-    id: int
-    title: str
-    location: str
-    description: str
-    join_detail: str
-    owner_id: int
+class Thumbnail(BaseModel):
+    width: int
+    webp: str
+    jpeg: str
 
-    images: list
+
+class NewImage(BaseModel):
+    id: int
+    new_id: int
+    image: str
+    thumbnails: List[Thumbnail]
 
     created_at: datetime
 
@@ -75,15 +87,21 @@ class New(BaseModel):
         orm_mode = True
 
 
-class NewImage(BaseModel):
+class New(BaseModel):
     id: int
-    new_id: int
-    image: str
+    title: str
+    location: str
+    description: str
+    join_detail: str
+    owner_id: int
+
+    images: List[NewImage]
 
     created_at: datetime
 
     class Config:
         orm_mode = True
+        load_options = (selectinload(models.New.images),)
 
 
 class NewCreate(BaseModel):
@@ -91,7 +109,6 @@ class NewCreate(BaseModel):
     location: str
     description: str
     join_detail: str
-    owner_id: int
 
     class Config:
         orm_mode = True
@@ -108,12 +125,12 @@ class Board(BaseModel):
 
     class Config:
         orm_mode = True
+        load_options = (selectinload(models.Board.discussions),)
 
 
 class BoardCreate(BaseModel):
     title: str
     body: str
-    owner_id: int
 
     class Config:
         orm_mode = True
@@ -125,7 +142,8 @@ class Discussion(BaseModel):
     owner_id: int
     board_id: int
 
-    details: list
+    like_count: int
+    dislike_count: int
 
     created_at: datetime
 
@@ -135,7 +153,6 @@ class Discussion(BaseModel):
 
 class DiscussionCreate(BaseModel):
     body: str
-    owner_id: int
 
     class Config:
         orm_mode = True
@@ -153,10 +170,16 @@ class DiscussionInteraction(BaseModel):
         orm_mode = True
 
 
+class DiscussionInteractionResult(DiscussionInteraction):
+    # the discussion's counts including this interaction
+    like_count: int
+    dislike_count: int
+
+
 class DiscussionInteractionCreate(BaseModel):
     discussion_id: int
     user_id: int
-    interaction_type: str
+    interaction_type: Literal["like", "dislike"]
 
     class Config:
         orm_mode = True
@@ -197,6 +220,7 @@ class Hotel(HotelBase):
 
     class Config:
         orm_mode = True
+        load_options = (selectinload(models.Hotel.facilities),)
 
 
 class RoomBase(BaseModel):
@@ -217,9 +241,53 @@ class Room(RoomBase):
         orm_mode = True
 
 
+class HotelAvailability(BaseModel):
+    hotel: Hotel
+    rooms: List[Room]
+
+
+class HotelListing(BaseModel):
+    hotel: Hotel
+    cheapest_room: Optional[Room] = None
+
+
+class FacilityFacet(Facility):
+    count: int
+
+
+class HotelFacets(BaseModel):
+    total: int
+    stars: Dict[int, int]
+    city: Dict[str, int]
+    country: Dict[str, int]
+    facilities: List[FacilityFacet]
+
+
+class HotelCatalog(BaseModel):
+    hotels: List[HotelListing]
+    facets: HotelFacets
+
+
+class HotelRevenuePoint(BaseModel):
+    bucket_start: date
+    revenue: int
+    room_nights: int
+
+
+class EventRevenuePoint(BaseModel):
+    bucket_start: date
+    revenue: int
+    tickets: int
+
+
+class RevenueDashboard(BaseModel):
+    bucket: str
+    hotels: List[HotelRevenuePoint]
+    events: List[EventRevenuePoint]
+
+
 class BookingBase(BaseModel):
     room_id: int
-    user_id: int
     check_in_date: datetime
     check_out_date: datetime
     guest_name: str
@@ -232,6 +300,7 @@ class BookingCreate(BookingBase):
 
 class Booking(BookingBase):
     booking_id: int
+    user_id: int
 
     class Config:
         orm_mode = True
@@ -263,18 +332,17 @@ class Event(EventBase):
 
 class EventBookingBase(BaseModel):
     event_id: int
-    user_id: int
     guest_name: str
     guest_email: str
 
 
 class EventBookingCreate(EventBookingBase):
-    amount: int
-    pass
+    amount: int = Field(..., ge=1)
 
 
 class EventBooking(EventBookingBase):
     booking_id: int
+    user_id: int
 
     class Config:
         orm_mode = True
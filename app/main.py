@@ -1,39 +1,54 @@
-from fastapi import Depends, FastAPI, HTTPException, File, UploadFile
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import Depends, FastAPI, HTTPException, Request, Query
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 
 from starlette.middleware import Middleware
 from starlette.middleware.cors import CORSMiddleware
 
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+
 from sqlalchemy.orm import Session
 
 import base64
-import io
-import random
-import string
+import os
+from datetime import date
+from typing import List, Optional
 
-from . import crud
-from .db import models
+from . import async_crud, crud
 from .db import schemas
 
-from .db.database import SessionLocal, engine
-
-models.Base.metadata.create_all(bind=engine)
+from .db.database import (
+    DB_ASYNC,
+    AsyncSessionLocal,
+    SessionLocal,
+    async_engine,
+    engine,
+    pool_stats,
+)
 
-# Create user types if not exists
-# 0: admin, 1: user
-userType = crud.get_user_type(SessionLocal())
-if len(userType) == 0:
-    db = SessionLocal()
-    db_user_type = models.UserType(id=0, name="admin")
-    db.add(db_user_type)
-    db.commit()
-    db.refresh(db_user_type)
-    db_user_type = models.UserType(id=1, name="user")
-    db.add(db_user_type)
-    db.commit()
-    db.refresh(db_user_type)
-    db.close()
+from .utils import authentication as auth
+from .utils import (
+    cert_export,
+    fast_json,
+    images,
+    metrics,
+    scheduler,
+    static_images,
+    streaming,
+)
+from .utils.cert_cache import cert_cache
+from .utils.certificate import (
+    render_certificate,
+    shutdown_render_pool,
+    start_render_pool,
+)
+from .utils.http_cache import etag_matches
 
 # Initial FastAPI
 app = FastAPI(
@@ -53,12 +68,87 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-app.mount("/imgs", StaticFiles(directory="app/imgs"), name="imgs")
+# per route latency, sql statement count, db time and rows, served at /metrics
+metrics.instrument_engine(engine)
+metrics.instrument_pool(engine, pool_stats)
+if DB_ASYNC:
+    metrics.instrument_engine(async_engine.sync_engine)
+    metrics.instrument_pool(async_engine.sync_engine, pool_stats, name="async")
+app.add_middleware(metrics.MetricsMiddleware)
+
+CARBON_RECONCILE_INTERVAL = int(os.getenv("CARBON_RECONCILE_INTERVAL", "3600"))
+# seconds between removals of expired certificate exports, 0 disables
+CERT_EXPORT_SWEEP_INTERVAL = int(os.getenv("CERT_EXPORT_SWEEP_INTERVAL", "3600"))
+
+
+def reconcile_carbon_totals():
+    db = SessionLocal()
+    try:
+        crud.reconcile_carbon_totals(db)
+    finally:
+        db.close()
+
+
+def backfill_revenue_summaries():
+    # bookings made before the summaries existed
+    db = SessionLocal()
+    try:
+        if crud.revenue_summaries_empty(db):
+            crud.rebuild_revenue_summaries(db)
+    finally:
+        db.close()
 
 
-def get_db():
+@app.on_event("startup")
+def startup():
+    start_render_pool()
+    images.backfill_thumbnails()
+    reconcile_carbon_totals()
+    backfill_revenue_summaries()
+    if CERT_EXPORT_SWEEP_INTERVAL > 0:
+        scheduler.run_every(
+            CERT_EXPORT_SWEEP_INTERVAL, cert_export.evict_expired_exports
+        )
+    if CARBON_RECONCILE_INTERVAL > 0:
+        scheduler.run_every(CARBON_RECONCILE_INTERVAL, reconcile_carbon_totals)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    scheduler.stop()
+    shutdown_render_pool()
+    images.shutdown_thumbnail_pool()
+    auth.shutdown_hash_pool()
+    if DB_ASYNC:
+        await async_engine.dispose()
+
+
+# uploads and thumbnails, named by content hash and cached as immutable, with
+# strong ETags, byte ranges and the WebP variant for clients accepting it
+app.mount("/imgs", static_images.ImageFiles(), name="imgs")
+
+
+async def get_db():
+    # routes await the async_crud coroutines with either session, DB_ASYNC
+    # picks asyncpg or the sync engine run in the threadpool
+    if DB_ASYNC:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            # closed on the loop: waiting for a free thread here could
+            # deadlock with threads waiting for this session's connection
+            db.close()
+
+
+def get_sync_db():
+    # for the streaming responses that keep iterating a sync result
     db = SessionLocal()
     try:
         yield db
@@ -66,14 +156,112 @@ def get_db():
         db.close()
 
 
+async def stream_query(crud_stream, format: str, *args):
+    # Streams the rows of a crud stream_* function from a sync session of
+    # its own, opened only for the stream and closed on the loop (see
+    # get_db) once the response has ended or the client went away.
+    db = SessionLocal()
+
+    async def close():
+        db.close()
+
+    try:
+        rows = await run_in_threadpool(crud_stream, db, *args)
+    except Exception:
+        await close()
+        raise
+    return streaming.stream_response(rows, format, background=BackgroundTask(close))
+
+
+@app.exception_handler(crud.InvalidPage)
+def invalid_page_handler(request: Request, exc: crud.InvalidPage):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
+@app.exception_handler(crud.SoldOut)
+def sold_out_handler(request: Request, exc: crud.SoldOut):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+
+@app.exception_handler(auth.InvalidToken)
+def invalid_token_handler(request: Request, exc: auth.InvalidToken):
+    return JSONResponse(
+        status_code=401,
+        content={"detail": str(exc)},
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+@app.exception_handler(images.InvalidImage)
+def invalid_image_handler(request: Request, exc: images.InvalidImage):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
+@app.exception_handler(images.ImageTooLarge)
+def image_too_large_handler(request: Request, exc: images.ImageTooLarge):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+def page_params(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    fields: Optional[str] = Query(None, description="Comma separated columns"),
+):
+    return {
+        "cursor": cursor,
+        "limit": limit,
+        "fields": fields.split(",") if fields else None,
+    }
+
+
+def stream_param(
+    stream: Optional[str] = Query(
+        None,
+        regex="^(ndjson|json)$",
+        description="Stream the whole collection as NDJSON or a JSON array",
+    ),
+):
+    return stream
+
+
+def stream_fields(page: dict, schema):
+    return page["fields"] or list(schema.__fields__)
+
+
+def list_response(rows: list, schema, headers: Optional[dict] = None):
+    # with FAST_JSON our own rows skip the response_model validation
+    if fast_json.FAST_JSON:
+        return fast_json.FastJSONResponse(
+            fast_json.dump_rows(rows, schema), headers=headers
+        )
+    return rows
+
+
+def page_response(response: Response, rows: list, next_cursor: str, page: dict, schema):
+    # the cursor for the next page goes in a header so list bodies stay lists
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if page["fields"] is not None:
+        # projected rows are plain dicts that do not fit the response_model
+        return fast_json.FastJSONResponse(rows, headers=dict(response.headers))
+    return list_response(rows, schema, dict(response.headers))
+
+
+@app.get("/metrics", summary="Prometheus Metrics", tags=["Metrics"])
+def get_metrics():
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get(
     "/users/{user_id}",
     response_model=schemas.User,
     summary="Read User by ID",
     tags=["Users"],
 )
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id=user_id)
+async def read_user(user_id: int, db: Session = Depends(get_db)):
+    db_user = await async_crud.get_user(db, user_id=user_id, eager=True)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
@@ -85,11 +273,14 @@ def read_user(user_id: int, db: Session = Depends(get_db)):
     summary="Create User",
     tags=["Users"],
 )
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await async_crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    hashed_password = await auth.hash_password(user.password)
+    return await async_crud.create_user(
+        db=db, user=user, hashed_password=hashed_password
+    )
 
 
 @app.post(
@@ -98,11 +289,18 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     summary="Login with Email and Password",
     tags=["Users"],
 )
-def login(email: str, password: str, db: Session = Depends(get_db)):
-    db_user = crud.login_user(db, email=email, password=password)
-    if db_user is None:
+async def login(email: str, password: str, db: Session = Depends(get_db)):
+    login = await async_crud.get_login(db, email=email)
+    if login is None:
         raise HTTPException(status_code=401, detail="Invalid email or password")
-    return db_user
+    valid, new_hash = await auth.check_password(password, login.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    if new_hash is not None:
+        await async_crud.update_password_hash(db, login.id, new_hash)
+    db_user = await async_crud.get_user(db, user_id=login.id, eager=True)
+    token = auth.get_user_token(db_user.id, db_user.user_type_id)
+    return {"access_token": token, "data": db_user}
 
 
 @app.get(
@@ -111,11 +309,24 @@ def login(email: str, password: str, db: Session = Depends(get_db)):
     summary="Read User Carbon",
     tags=["Carbon"],
 )
-def read_user_carbon(user_id: int, db: Session = Depends(get_db)):
-    user_carbon = crud.get_user_carbon(db, user_id=user_id)
-    if user_carbon is None:
-        raise HTTPException(status_code=404, detail="No donate not found")
-    return user_carbon
+async def read_user_carbon(
+    user_id: int,
+    response: Response,
+    page: dict = Depends(page_params),
+    stream: Optional[str] = Depends(stream_param),
+    db: Session = Depends(get_db),
+):
+    if stream is not None:
+        return await stream_query(
+            crud.stream_user_carbon,
+            stream,
+            user_id,
+            stream_fields(page, schemas.UserCarbon),
+        )
+    user_carbon, next_cursor = await async_crud.get_user_carbon(
+        db, user_id=user_id, **page
+    )
+    return page_response(response, user_carbon, next_cursor, page, schemas.UserCarbon)
 
 
 @app.post(
@@ -124,10 +335,10 @@ def read_user_carbon(user_id: int, db: Session = Depends(get_db)):
     summary="Create User Carbon Donate",
     tags=["Carbon"],
 )
-def create_user_carbon(
+async def create_user_carbon(
     user_carbon: schemas.UserCarbonCreate, db: Session = Depends(get_db)
 ):
-    user_carbon = crud.create_user_carbon(db=db, user_carbon=user_carbon)
+    user_carbon = await async_crud.create_user_carbon(db=db, user_carbon=user_carbon)
     if user_carbon is None:
         raise HTTPException(status_code=400, detail="Invalid user_id")
     return user_carbon
@@ -135,25 +346,48 @@ def create_user_carbon(
 
 # get all sum carbon offset
 @app.get("/carbon/all", summary="Get All Carbon Details", tags=["Carbon"])
-def get_all_carbon(db: Session = Depends(get_db)):
-    all_carbon = crud.get_all_carbon(db)
+async def get_all_carbon(db: Session = Depends(get_db)):
+    all_carbon = await async_crud.get_all_carbon(db)
     return all_carbon
 
 
+@app.get(
+    "/carbon/all/rows",
+    response_model=list[schemas.UserCarbon],
+    summary="Read All Carbon Donations, paginated",
+    tags=["Carbon"],
+)
+async def get_all_carbon_rows(
+    response: Response,
+    page: dict = Depends(page_params),
+    stream: Optional[str] = Depends(stream_param),
+    db: Session = Depends(get_db),
+):
+    if stream is not None:
+        return await stream_query(
+            crud.stream_all_carbon_rows, stream, stream_fields(page, schemas.UserCarbon)
+        )
+    rows, next_cursor = await async_crud.get_all_carbon_rows(db, **page)
+    return page_response(response, rows, next_cursor, page, schemas.UserCarbon)
+
+
 @app.get(
     "/news", response_model=list[schemas.New], summary="Read All News", tags=["News"]
 )
-def read_news(db: Session = Depends(get_db)):
-    news = crud.get_news(db)
-    return news
+async def read_news(
+    response: Response, page: dict = Depends(page_params), db: Session = Depends(get_db)
+):
+    news, next_cursor = await async_crud.get_news(db, **page)
+    return page_response(response, news, next_cursor, page, schemas.New)
 
 
 @app.post("/news", response_model=schemas.New, summary="Create News", tags=["News"])
-def create_news(news: schemas.NewCreate, db: Session = Depends(get_db)):
-    news = crud.create_news(db=db, news=news)
-    if news is None:
-        raise HTTPException(status_code=400, detail="Invalid owner_id")
-    return news
+async def create_news(
+    news: schemas.NewCreate,
+    user: auth.CurrentUser = Depends(auth.current_user),
+    db: Session = Depends(get_db),
+):
+    return await async_crud.create_news(db=db, news=news, owner_id=user.id)
 
 
 @app.get(
@@ -162,9 +396,11 @@ def create_news(news: schemas.NewCreate, db: Session = Depends(get_db)):
     summary="Read All Boards",
     tags=["Boards"],
 )
-def read_boards(db: Session = Depends(get_db)):
-    boards = crud.get_boards(db)
-    return boards
+async def read_boards(
+    response: Response, page: dict = Depends(page_params), db: Session = Depends(get_db)
+):
+    boards, next_cursor = await async_crud.get_boards(db, **page)
+    return page_response(response, boards, next_cursor, page, schemas.Board)
 
 
 @app.get(
@@ -173,8 +409,8 @@ def read_boards(db: Session = Depends(get_db)):
     summary="Read Board by ID",
     tags=["Boards"],
 )
-def read_board(board_id: int, db: Session = Depends(get_db)):
-    board = crud.get_board_by_id(db, board_id=board_id)
+async def read_board(board_id: int, db: Session = Depends(get_db)):
+    board = await async_crud.get_board_by_id(db, board_id=board_id)
     if board is None:
         raise HTTPException(status_code=404, detail="Board not found")
     return board
@@ -183,11 +419,12 @@ def read_board(board_id: int, db: Session = Depends(get_db)):
 @app.post(
     "/boards", response_model=schemas.Board, summary="Create Board", tags=["Boards"]
 )
-def create_board(board: schemas.BoardCreate, db: Session = Depends(get_db)):
-    board = crud.create_board(db=db, board=board)
-    if board is None:
-        raise HTTPException(status_code=400, detail="Invalid owner_id")
-    return board
+async def create_board(
+    board: schemas.BoardCreate,
+    user: auth.CurrentUser = Depends(auth.current_user),
+    db: Session = Depends(get_db),
+):
+    return await async_crud.create_board(db=db, board=board, owner_id=user.id)
 
 
 @app.post(
@@ -195,13 +432,15 @@ def create_board(board: schemas.BoardCreate, db: Session = Depends(get_db)):
     response_model=schemas.Discussion,
     tags=["Discussions"],
 )
-def create_discussion(
-    board_id: int, discussion: schemas.DiscussionCreate, db: Session = Depends(get_db)
+async def create_discussion(
+    board_id: int,
+    discussion: schemas.DiscussionCreate,
+    user: auth.CurrentUser = Depends(auth.current_user),
+    db: Session = Depends(get_db),
 ):
-    discussion = crud.create_discussion(db=db, board_id=board_id, discussion=discussion)
-    if discussion is None:
-        raise HTTPException(status_code=400, detail="Invalid owner_id or board_id")
-    return discussion
+    return await async_crud.create_discussion(
+        db=db, board_id=board_id, discussion=discussion, owner_id=user.id
+    )
 
 
 @app.get(
@@ -209,22 +448,22 @@ def create_discussion(
     response_model=list[schemas.Discussion],
     tags=["Discussions"],
 )
-def read_discussions(board_id: int, db: Session = Depends(get_db)):
-    discussions = crud.get_discussions_by_board_id(db, board_id=board_id)
-    return discussions
+async def read_discussions(board_id: int, db: Session = Depends(get_db)):
+    discussions = await async_crud.get_discussions_by_board_id(db, board_id=board_id)
+    return list_response(discussions, schemas.Discussion)
 
 
 @app.post(
     "/discussions/{discussion_id}/interaction",
-    response_model=schemas.DiscussionInteraction,
+    response_model=schemas.DiscussionInteractionResult,
     tags=["Discussions"],
 )
-def create_discussion_interaction(
+async def create_discussion_interaction(
     discussion_id: int,
     interaction: schemas.DiscussionInteractionCreate,
     db: Session = Depends(get_db),
 ):
-    interaction = crud.create_discussion_interaction(
+    interaction = await async_crud.create_discussion_interaction(
         db=db,
         discussion_id=discussion_id,
         discussion_interaction=interaction,
@@ -234,68 +473,246 @@ def create_discussion_interaction(
     return interaction
 
 
+def cert_headers(digest: str):
+    return {
+        "ETag": f'"{digest}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+
+
+def cert_response(png: bytes, format: str, headers: dict = None):
+    # some frontend callers still expect the base64 string instead of the png
+    if format == "base64":
+        return PlainTextResponse(base64.b64encode(png), headers=headers)
+    return Response(png, media_type="image/png", headers=headers)
+
+
 @app.get(
     "/cert",
     summary="Get Certificate",
     tags=["Certificate"],
     response_class=FileResponse,
 )
-def get_certificate(name: str, co2_amount: str, date: str, cert_id: str):
-    base64_encoded_image = crud.get_certificate(name, co2_amount, date, cert_id)
-    base64_decoded_image = base64.b64decode(base64_encoded_image)
-    return StreamingResponse(io.BytesIO(base64_decoded_image), media_type="image/png")
+async def get_certificate(
+    name: str,
+    co2_amount: str,
+    date: str,
+    cert_id: str,
+    format: str = Query("png", regex="^(png|base64)$"),
+):
+    png = await render_certificate(name, co2_amount, date, cert_id)
+    return cert_response(png, format)
+
+
+def check_period(start: date, end: date):
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+
+
+@app.get(
+    "/cert/export",
+    summary="Export Certificates issued between two dates as ZIP",
+    tags=["Certificate"],
+    response_class=StreamingResponse,
+)
+def export_certificates(start: date, end: date, db: Session = Depends(get_sync_db)):
+    check_period(start, end)
+    certs = crud.get_certs_by_date(db, start, end)
+    zip_stream = cert_export.iter_zip(cert_export.iter_certificates(certs))
+    filename = cert_export.export_filename(start, end)
+    return StreamingResponse(
+        zip_stream,
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.post(
+    "/cert/exports",
+    summary="Start Background Certificate Export",
+    tags=["Certificate"],
+)
+def start_certificate_export(start: date, end: date):
+    check_period(start, end)
+    job = cert_export.start_export_job(start, end)
+    return job.as_dict()
+
+
+@app.get(
+    "/cert/exports/{job_id}",
+    summary="Get Certificate Export Status",
+    tags=["Certificate"],
+)
+def get_certificate_export(job_id: str):
+    job = cert_export.get_export_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job.as_dict()
+
+
+@app.get(
+    "/cert/exports/{job_id}/download",
+    summary="Download Certificate Export",
+    tags=["Certificate"],
+    response_class=StreamingResponse,
+)
+def download_certificate_export(job_id: str):
+    job = cert_export.get_export_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail="Export is " + job.status)
+    stored = cert_export.exports.stat(job.zip_key)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    filename = cert_export.export_filename(job.start, job.end)
+    url = cert_export.exports.url(job.zip_key, filename=filename)
+    if url is not None:
+        return Response(status_code=307, headers={"Location": url})
+    return StreamingResponse(
+        cert_export.exports.iter_range(job.zip_key, 0, stored.size),
+        media_type="application/zip",
+        headers={
+            "Content-Length": str(stored.size),
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        },
+    )
 
 
 @app.get(
     "/cert/{carbon_id}", summary="Get Certificate with carbon_id", tags=["Certificate"]
 )
-def get_cert_by_carbon_id(carbon_id: int, db: Session = Depends(get_db)):
-    cert = crud.get_cert_by_carbon_id(db, carbon_id)
+async def get_cert_by_carbon_id(
+    carbon_id: int,
+    request: Request,
+    format: str = Query("png", regex="^(png|base64)$"),
+    db: Session = Depends(get_db),
+):
+    # revalidation of an already rendered certificate needs neither the db nor the png
+    if_none_match = request.headers.get("if-none-match")
+    digest = None
+    if if_none_match:
+        digest = await run_in_threadpool(cert_cache.digest, carbon_id)
+    if digest is not None and etag_matches(if_none_match, f'"{digest}"'):
+        return Response(status_code=304, headers=cert_headers(digest))
+
+    cert = await run_in_threadpool(cert_cache.get, carbon_id)
     if cert is None:
-        raise HTTPException(status_code=404, detail="Certificate not found")
-    base64_decoded_image = base64.b64decode(cert)
-    return StreamingResponse(io.BytesIO(base64_decoded_image), media_type="image/png")
+        detail = await async_crud.get_cert_detail(db, carbon_id)
+        if detail is None:
+            raise HTTPException(status_code=404, detail="Certificate not found")
+        png = await render_certificate(**detail)
+        cert = await run_in_threadpool(cert_cache.put, carbon_id, png)
+    digest, png = cert
+    if etag_matches(if_none_match, f'"{digest}"'):
+        return Response(status_code=304, headers=cert_headers(digest))
+    return cert_response(png, format, headers=cert_headers(digest))
 
 
 @app.post(
     "/uploadNewImage",
     summary="Upload New Image",
     tags=["Upload"],
+    response_model=schemas.NewImage,
 )
-def upload_new_image(
+async def upload_new_image(
     news_id: int,
-    file: UploadFile = File(...),
+    request: Request,
     db: Session = Depends(get_db),
 ):
-    check = crud.get_news_by_id(db, news_id)
-    if check is None:
+    # multipart/form-data with the jpeg in the "file" field, read from the
+    # request stream instead of a form parameter so it is written to disk as
+    # it arrives
+    # checked up front, the connection goes back to the pool before the
+    # body is streamed to disk and the thumbnails are rendered
+    if not await async_crud.news_exists(db, news_id):
         raise HTTPException(status_code=404, detail="News not found")
 
-    if file.content_type not in ["image/jpeg", "image/jpg"]:
-        raise HTTPException(
-            status_code=400, detail="Invalid file type, only jpeg accept"
-        )
+    image = await images.save_image(request)
+    return await async_crud.upload_new_image(db, news_id, image)
+
+
+@app.get(
+    "/hotels",
+    summary="Search Hotels",
+    tags=["Hotels"],
+    response_model=schemas.HotelCatalog,
+)
+async def get_all_hotels(
+    response: Response,
+    stars: Optional[List[int]] = Query(None),
+    min_rating: Optional[int] = None,
+    city: Optional[str] = None,
+    country: Optional[str] = None,
+    facility: Optional[List[int]] = Query(None, description="Facility ids"),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+):
+    # a page of hotels with the cheapest room of each, and facet counts over
+    # every hotel matching the filters
+    filters = {
+        "stars": stars,
+        "min_rating": min_rating,
+        "city": city,
+        "country": country,
+        "facilities": facility,
+    }
+    hotels, next_cursor = await async_crud.get_all_hotels(
+        db, cursor=cursor, limit=limit, **filters
+    )
+    cheapest_rooms = await async_crud.get_cheapest_rooms(
+        db, [hotel.hotel_id for hotel in hotels]
+    )
+    facets = await async_crud.get_hotel_facets(db, **filters)
 
-    uploadname = "new_" + "".join(random.choices(string.ascii_lowercase, k=10))
-    if file:
-        with open(f"app/imgs/{uploadname}.jpg", "wb") as buffer:
-            buffer.write(file.file.read())
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return {
+        "hotels": [
+            {"hotel": hotel, "cheapest_room": cheapest_rooms.get(hotel.hotel_id)}
+            for hotel in hotels
+        ],
+        "facets": facets,
+    }
 
-        upload = crud.upload_new_image(db, news_id, uploadname)
 
-    return upload
+def check_stay(check_in: date, check_out: date):
+    if check_out <= check_in:
+        raise HTTPException(status_code=400, detail="check_out must be after check_in")
 
 
 @app.get(
-    "/hotels",
-    summary="Get All Hotels",
+    "/hotels/search",
+    summary="Search Hotels with Rooms Free for a Stay",
     tags=["Hotels"],
+    response_model=list[schemas.HotelAvailability],
 )
-def get_all_hotels(db: Session = Depends(get_db)):
-    hotels = crud.get_all_hotels(db)
-    get_cheapest_rooms = crud.get_cheapest_rooms(db)
-
-    return {"hotels": hotels, "cheapest_rooms": get_cheapest_rooms}
+async def search_hotels(
+    city: str,
+    check_in: date,
+    check_out: date,
+    response: Response,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+):
+    check_stay(check_in, check_out)
+    hotels, next_cursor = await async_crud.search_hotels(
+        db,
+        city=city,
+        check_in=check_in,
+        check_out=check_out,
+        min_price=min_price,
+        max_price=max_price,
+        cursor=cursor,
+        limit=limit,
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return hotels
 
 
 @app.get(
@@ -304,8 +721,20 @@ def get_all_hotels(db: Session = Depends(get_db)):
     tags=["Hotels"],
     response_model=list[schemas.Room],
 )
-def get_available_rooms(hotel_id: int, db: Session = Depends(get_db)):
-    rooms = crud.get_available_rooms(db, hotel_id)
+async def get_available_rooms(
+    hotel_id: int,
+    check_in: Optional[date] = None,
+    check_out: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
+    # with both dates, only room types free on every night of the stay
+    if (check_in is None) != (check_out is None):
+        raise HTTPException(
+            status_code=400, detail="check_in and check_out go together"
+        )
+    if check_in is not None:
+        check_stay(check_in, check_out)
+    rooms = await async_crud.get_available_rooms(db, hotel_id, check_in, check_out)
     return rooms
 
 
@@ -314,8 +743,8 @@ def get_available_rooms(hotel_id: int, db: Session = Depends(get_db)):
     summary="Get Info by Room ID",
     tags=["Hotels"],
 )
-def get_info_by_room_id(room_id: int, db: Session = Depends(get_db)):
-    info = crud.get_info_by_room_id(db, room_id)
+async def get_info_by_room_id(room_id: int, db: Session = Depends(get_db)):
+    info = await async_crud.get_info_by_room_id(db, room_id)
     return info
 
 
@@ -325,9 +754,9 @@ def get_info_by_room_id(room_id: int, db: Session = Depends(get_db)):
     tags=["Bookings"],
     response_model=list[schemas.Booking],
 )
-def get_bookings_by_user_id(user_id: int, db: Session = Depends(get_db)):
-    bookings = crud.get_bookings_by_user_id(db, user_id)
-    return bookings
+async def get_bookings_by_user_id(user_id: int, db: Session = Depends(get_db)):
+    bookings = await async_crud.get_bookings_by_user_id(db, user_id)
+    return list_response(bookings, schemas.Booking)
 
 
 @app.get(
@@ -336,14 +765,23 @@ def get_bookings_by_user_id(user_id: int, db: Session = Depends(get_db)):
     tags=["Bookings"],
     response_model=list[schemas.Booking],
 )
-def get_all_bookings(db: Session = Depends(get_db)):
-    bookings = crud.get_all_bookings(db)
-    return bookings
+async def get_all_bookings(
+    response: Response,
+    page: dict = Depends(page_params),
+    stream: Optional[str] = Depends(stream_param),
+    db: Session = Depends(get_db),
+):
+    if stream is not None:
+        return await stream_query(
+            crud.stream_all_bookings, stream, stream_fields(page, schemas.Booking)
+        )
+    bookings, next_cursor = await async_crud.get_all_bookings(db, **page)
+    return page_response(response, bookings, next_cursor, page, schemas.Booking)
 
 
 @app.get("/summaryHotel/{hotel_id}", summary="Get Summary of Hotel", tags=["Hotels"])
-def get_summary_hotel(hotel_id: int, db: Session = Depends(get_db)):
-    summary = crud.get_summary_hotel(db, hotel_id)
+async def get_summary_hotel(hotel_id: int, db: Session = Depends(get_db)):
+    summary = await async_crud.get_summary_hotel(db, hotel_id)
     return {"summary_income": summary}
 
 
@@ -353,15 +791,24 @@ def get_summary_hotel(hotel_id: int, db: Session = Depends(get_db)):
     tags=["Bookings"],
     response_model=schemas.Booking,
 )
-def book_room(booking: schemas.BookingCreate, db: Session = Depends(get_db)):
-    booking = crud.book_room(db, booking)
+async def book_room(
+    booking: schemas.BookingCreate,
+    user: auth.CurrentUser = Depends(auth.current_user),
+    db: Session = Depends(get_db),
+):
+    check_stay(booking.check_in_date.date(), booking.check_out_date.date())
+    booking = await async_crud.book_room(db, booking, user.id)
+    if booking is None:
+        raise HTTPException(status_code=404, detail="Room not found")
     return booking
 
 
 @app.get("/events", summary="Get All Events", tags=["Events"])
-def get_all_events(db: Session = Depends(get_db)):
-    events = crud.get_all_events(db)
-    return events
+async def get_all_events(
+    response: Response, page: dict = Depends(page_params), db: Session = Depends(get_db)
+):
+    events, next_cursor = await async_crud.get_all_events(db, **page)
+    return page_response(response, events, next_cursor, page, schemas.Event)
 
 
 @app.post(
@@ -370,8 +817,14 @@ def get_all_events(db: Session = Depends(get_db)):
     tags=["Events"],
     response_model=list[schemas.EventBooking],
 )
-def book_event(event: schemas.EventBookingCreate, db: Session = Depends(get_db)):
-    event = crud.book_event(db, event)
+async def book_event(
+    event: schemas.EventBookingCreate,
+    user: auth.CurrentUser = Depends(auth.current_user),
+    db: Session = Depends(get_db),
+):
+    event = await async_crud.book_event(db, event, user.id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
     return event
 
 
@@ -381,27 +834,65 @@ def book_event(event: schemas.EventBookingCreate, db: Session = Depends(get_db))
     tags=["Events"],
     response_model=list[schemas.EventBooking],
 )
-def get_all_event_bookings(db: Session = Depends(get_db)):
-    event_bookings = crud.get_all_event_bookings(db)
-    return event_bookings
+async def get_all_event_bookings(
+    response: Response,
+    page: dict = Depends(page_params),
+    stream: Optional[str] = Depends(stream_param),
+    db: Session = Depends(get_db),
+):
+    if stream is not None:
+        return await stream_query(
+            crud.stream_all_event_bookings,
+            stream,
+            stream_fields(page, schemas.EventBooking),
+        )
+    event_bookings, next_cursor = await async_crud.get_all_event_bookings(db, **page)
+    return page_response(
+        response, event_bookings, next_cursor, page, schemas.EventBooking
+    )
 
 
 @app.get("/summaryEvent/{event_id}", summary="Get Summary of Event", tags=["Events"])
-def get_summary_event(event_id: int, db: Session = Depends(get_db)):
-    summary = crud.get_summary_event(db, event_id)
+async def get_summary_event(event_id: int, db: Session = Depends(get_db)):
+    summary = await async_crud.get_summary_event(db, event_id)
     return {"summary_income": summary}
 
 
+@app.get(
+    "/dashboard/revenue",
+    summary="Get Hotel and Event Revenue over Time",
+    tags=["Dashboard"],
+    response_model=schemas.RevenueDashboard,
+)
+async def get_revenue_dashboard(
+    start: date,
+    end: date,
+    bucket: str = Query("day", regex="^(day|week|month)$"),
+    hotel_id: Optional[int] = None,
+    event_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    # revenue from start up to (not including) end, per bucket
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    return await async_crud.get_revenue_dashboard(
+        db, start, end, bucket=bucket, hotel_id=hotel_id, event_id=event_id
+    )
+
+
 @app.get(
     "/getUserBookedEvent/{user_id}",
     summary="Get User Booked Event",
     tags=["Users"],
 )
-def get_user_booked_event(user_id: int, db: Session = Depends(get_db)):
-    events = crud.get_user_booked_event(db, user_id)
+async def get_user_booked_event(user_id: int, db: Session = Depends(get_db)):
+    events = await async_crud.get_user_booked_event(db, user_id)
     return events
 
-@app.get("/getUserBookedHotel/{user_id}", summary="Get User Booked Hotel", tags=["Users"])
-def get_user_booked_hotel(user_id: int, db: Session = Depends(get_db)):
-    hotels = crud.get_user_booked_hotel(db, user_id)
-    return hotels
\ No newline at end of file
+
+@app.get(
+    "/getUserBookedHotel/{user_id}", summary="Get User Booked Hotel", tags=["Users"]
+)
+async def get_user_booked_hotel(user_id: int, db: Session = Depends(get_db)):
+    hotels = await async_crud.get_user_booked_hotel(db, user_id)
+    return hotels
@@ -1,19 +1,152 @@
+from fastapi import Depends
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from passlib.context import CryptContext
-from jose import jwt
+from jose import JWTError, jwk, jwt
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import asyncio
+import functools
 import os
+import threading
+import time
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# cost of new hashes, a hash made with another cost is replaced on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, a few threads of its own keep logins from
+# occupying the threadpool every other route runs in
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+JWT_SECRET = os.getenv("JWT_SECRET")
+JWT_ALGORITHM = "HS256"
+JWT_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES", "60"))
+# verified tokens kept in memory, a repeated token skips the signature check
+JWT_CACHE_ITEMS = int(os.getenv("JWT_CACHE_ITEMS", "4096"))
+
+ROLES = {0: "admin", 1: "user"}  # user_types ids
+
+# identity of the caller, read from the token claims
+CurrentUser = namedtuple("CurrentUser", ["id", "role"])
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_desired_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_desired_rounds=BCRYPT_ROUNDS,
+)
 
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password, hashed_password):
+    # (valid, new hash or None when the stored one has the current cost)
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+_hash_pool = None
+
+
+def start_hash_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(
+            max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt"
+        )
+    return _hash_pool
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown()
+        _hash_pool = None
+
+
+async def hash_password(password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(start_hash_pool(), get_password_hash, password)
+
+
+async def check_password(plain_password, hashed_password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        start_hash_pool(), verify_and_update_password, plain_password, hashed_password
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def signing_key():
+    # built once instead of on every jwt.encode and jwt.decode
+    return jwk.construct(JWT_SECRET, JWT_ALGORITHM)
+
+
 def get_access_token(data: dict):
-    secret = os.getenv("JWT_SECRET")
     to_encode = data.copy()
-    return jwt.encode(to_encode, secret, algorithm="HS256")
+    now = int(time.time())
+    to_encode.setdefault("iat", now)
+    to_encode.setdefault("exp", now + JWT_EXPIRE_MINUTES * 60)
+    return jwt.encode(to_encode, signing_key(), algorithm=JWT_ALGORITHM)
+
+
+def get_user_token(user_id: int, user_type_id: int):
+    return get_access_token(
+        {"sub": str(user_id), "role": ROLES.get(user_type_id, "user")}
+    )
+
+
+class InvalidToken(Exception):
+    pass
+
+
+_verified = OrderedDict()  # token -> (CurrentUser, exp)
+_verified_lock = threading.Lock()
+
+
+def verify_token(token: str):
+    now = time.time()
+    with _verified_lock:
+        cached = _verified.get(token)
+        if cached is not None:
+            if cached[1] > now:
+                _verified.move_to_end(token)
+                return cached[0]
+            del _verified[token]
+
+    try:
+        claims = jwt.decode(
+            token,
+            signing_key(),
+            algorithms=[JWT_ALGORITHM],
+            options={"require_exp": True, "require_sub": True},
+        )
+        user = CurrentUser(int(claims["sub"]), claims.get("role", "user"))
+    except (JWTError, ValueError):
+        raise InvalidToken("Invalid or expired token")
+    # jose compares exp with whole seconds, the cache with the exact time
+    if claims["exp"] <= now:
+        raise InvalidToken("Invalid or expired token")
+
+    with _verified_lock:
+        _verified[token] = (user, claims["exp"])
+        while len(_verified) > JWT_CACHE_ITEMS:
+            _verified.popitem(last=False)
+    return user
+
+
+bearer = HTTPBearer(auto_error=False)
+
+
+async def current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer),
+):
+    # Route dependency: the caller of a request with a valid
+    # "Authorization: Bearer <token>" header, without a database query.
+    if credentials is None:
+        raise InvalidToken("Not authenticated")
+    return verify_token(credentials.credentials)
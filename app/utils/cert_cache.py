@@ -0,0 +1,75 @@
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+from .storage import make_storage
+
+CERT_CACHE_DIR = os.getenv(
+    "CERT_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", "certs")
+)
+CERT_CACHE_MEMORY_ITEMS = int(os.getenv("CERT_CACHE_MEMORY_ITEMS", "32"))
+
+
+# Render-once store for certificate PNGs: blobs in the storage are named by
+# their sha256 digest, each carbon_id has a pointer naming its digest, and a
+# bounded LRU of recent certificates sits in front of the storage.
+class CertificateCache:
+    def __init__(self, storage, max_items: int):
+        self.storage = storage
+        self.max_items = max_items
+        self._memory = OrderedDict()  # carbon_id -> (digest, png)
+        self._lock = threading.Lock()
+
+    def _blob_key(self, digest: str):
+        return f"blobs/{digest[:2]}/{digest}.png"
+
+    def _pointer_key(self, carbon_id: int):
+        return f"carbon/{carbon_id}"
+
+    def _remember(self, carbon_id: int, digest: str, png: bytes):
+        with self._lock:
+            self._memory[carbon_id] = (digest, png)
+            self._memory.move_to_end(carbon_id)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def digest(self, carbon_id: int):
+        with self._lock:
+            cached = self._memory.get(carbon_id)
+        if cached is not None:
+            return cached[0]
+        pointer = self.storage.read(self._pointer_key(carbon_id))
+        return pointer.decode().strip() if pointer is not None else None
+
+    def get(self, carbon_id: int):
+        with self._lock:
+            cached = self._memory.get(carbon_id)
+            if cached is not None:
+                self._memory.move_to_end(carbon_id)
+                return cached
+
+        digest = self.digest(carbon_id)
+        if digest is None:
+            return None
+        png = self.storage.read(self._blob_key(digest))
+        if png is None:
+            return None
+
+        self._remember(carbon_id, digest, png)
+        return digest, png
+
+    def put(self, carbon_id: int, png: bytes):
+        digest = hashlib.sha256(png).hexdigest()
+        blob_key = self._blob_key(digest)
+        if not self.storage.exists(blob_key):
+            self.storage.write(blob_key, png)
+        self.storage.write(self._pointer_key(carbon_id), digest.encode())
+
+        self._remember(carbon_id, digest, png)
+        return digest, png
+
+
+cert_cache = CertificateCache(
+    make_storage("certs", CERT_CACHE_DIR), CERT_CACHE_MEMORY_ITEMS
+)
@@ -0,0 +1,213 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from datetime import date, datetime
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import uuid
+import zipfile
+
+from .. import crud
+from ..db.database import SessionLocal
+from .cert_cache import cert_cache
+from .certificate import CERT_RENDER_WORKERS, make_certificate, start_render_pool
+from .storage import make_storage
+
+logger = logging.getLogger(__name__)
+
+CERT_EXPORT_DIR = os.getenv(
+    "CERT_EXPORT_DIR", os.path.join(os.path.dirname(__file__), "..", "exports")
+)
+CERT_EXPORT_JOBS = int(os.getenv("CERT_EXPORT_JOBS", "1"))
+# finished exports are kept this long (seconds) before they are removed
+CERT_EXPORT_TTL = int(os.getenv("CERT_EXPORT_TTL", str(24 * 3600)))
+
+
+def iter_certificates(certs):
+    # (user_carbon, png) in order, cache misses are rendered on the worker
+    # pool with a bounded number of renders in flight
+    pool = start_render_pool()
+    pending = deque()
+    for user_carbon, detail in certs:
+        cached = cert_cache.get(user_carbon.id)
+        if cached is not None:
+            pending.append((user_carbon, cached[1]))
+        else:
+            pending.append((user_carbon, pool.submit(make_certificate, **detail)))
+
+        while pending and (
+            len(pending) > CERT_RENDER_WORKERS * 2 or isinstance(pending[0][1], bytes)
+        ):
+            yield _resolve(*pending.popleft())
+
+    while pending:
+        yield _resolve(*pending.popleft())
+
+
+def _resolve(user_carbon, png):
+    if not isinstance(png, bytes):
+        png = cert_cache.put(user_carbon.id, png.result())[1]
+    return user_carbon, png
+
+
+class _ChunkWriter:
+    # write-only file object, zipfile falls back to data descriptors for it
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(certificates):
+    # png is already deflated, so entries are stored as-is
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for user_carbon, png in certificates:
+            info = zipfile.ZipInfo(
+                "RCC" + str(user_carbon.id).zfill(10) + ".png",
+                date_time=user_carbon.created_at.timetuple()[:6],
+            )
+            zf.writestr(info, png)
+            yield writer.take()
+    yield writer.take()
+
+
+def export_filename(start: date, end: date):
+    return f"certificates_{start.isoformat()}_{end.isoformat()}.zip"
+
+
+class ExportJob:
+    # state of a background export, saved as <id>.json next to <id>.zip in
+    # the exports store so every worker and replica sees the same jobs
+    def __init__(self, start: date, end: date):
+        self.id = uuid.uuid4().hex
+        self.start = start
+        self.end = end
+        self.status = "pending"  # pending, running, done, failed
+        self.total = None
+        self.done = 0
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self.error = None  # why a failed job failed
+
+    @property
+    def zip_key(self):
+        return self.id + ".zip"
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "start": self.start,
+            "end": self.end,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    def save(self):
+        state = dict(self.as_dict(), updated_at=time.time())
+        exports.write(self.id + ".json", json.dumps(state, default=str).encode())
+
+    @classmethod
+    def load(cls, job_id: str):
+        data = exports.read(job_id + ".json") if JOB_ID.fullmatch(job_id) else None
+        if data is None:
+            return None
+        state = json.loads(data)
+        job = cls(date.fromisoformat(state["start"]), date.fromisoformat(state["end"]))
+        job.id = state["id"]
+        job.status = state["status"]
+        job.total = state["total"]
+        job.done = state["done"]
+        job.created_at = datetime.fromisoformat(state["created_at"])
+        if state["finished_at"] is not None:
+            job.finished_at = datetime.fromisoformat(state["finished_at"])
+        job.error = state.get("error")
+        return job
+
+
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+exports = make_storage("exports", CERT_EXPORT_DIR)
+_job_executor = ThreadPoolExecutor(max_workers=CERT_EXPORT_JOBS)
+
+
+def _run_export(job: ExportJob):
+    db = SessionLocal()
+    os.makedirs(CERT_EXPORT_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CERT_EXPORT_DIR, suffix=".part")
+    try:
+        job.status = "running"
+        job.total = crud.count_certs_by_date(db, job.start, job.end)
+        job.save()
+        saved_at = time.monotonic()
+
+        def counted(certificates):
+            nonlocal saved_at
+            for user_carbon, png in certificates:
+                yield user_carbon, png
+                job.done += 1
+                if time.monotonic() - saved_at > 1:
+                    job.save()
+                    saved_at = time.monotonic()
+
+        certs = crud.get_certs_by_date(db, job.start, job.end)
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter_zip(counted(iter_certificates(certs))):
+                f.write(chunk)
+        exports.put_file(job.zip_key, tmp_path)
+        job.status = "done"
+    except Exception as exc:
+        # nothing reads the executor's future, the saved job is the report
+        logger.exception("certificate export %s failed", job.id)
+        job.status = "failed"
+        job.error = str(exc) or type(exc).__name__
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        job.finished_at = datetime.now()
+        job.save()
+        db.close()
+
+
+def start_export_job(start: date, end: date):
+    job = ExportJob(start, end)
+    job.save()
+    _job_executor.submit(_run_export, job)
+    return job
+
+
+def get_export_job(job_id: str):
+    return ExportJob.load(job_id)
+
+
+def evict_expired_exports():
+    # Removes the state and the zip of jobs not updated for CERT_EXPORT_TTL
+    # seconds. A running job saves its progress every second, so this only
+    # drops finished jobs and those whose process died.
+    cutoff = time.time() - CERT_EXPORT_TTL
+    for key in exports.list():
+        if not key.endswith(".json"):
+            continue
+        data = exports.read(key)
+        if data is None or json.loads(data)["updated_at"] >= cutoff:
+            continue
+        job_id = key[: -len(".json")]
+        exports.delete(job_id + ".zip")
+        exports.delete(key)
@@ -1,60 +1,187 @@
 from PIL import Image, ImageFont, ImageDraw
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import asyncio
+import math
+import multiprocessing
 import os
 from io import BytesIO
-import base64
 
+my_path = os.path.dirname(__file__)
 
-def make_certificate(name: str, co2_amount: str, date: str, cert_id: str):
-    my_path = os.path.dirname(__file__)
-
-    MAIN_FONT = my_path + r"/../assets/font/Alegreya.ttf"
-    OTHER_FONT = my_path + r"/../assets/font/OpenSans.ttf"
-    NAME_COLOR = "#C8931D"
-    CO2_AMOUNT_COLOR = "#C8931D"
-    DATE_COLOR = "#6F4C00"
-    CERT_ID_COLOR = "#6F4C00"
-
-    TEMPLATE = Image.open(my_path + r"/../assets/cert_template.png")
-    WIDTH, HEIGHT = TEMPLATE.size
-
-    name_font = ImageFont.truetype(MAIN_FONT, 100)
-    co2_amount_font = ImageFont.truetype(MAIN_FONT, 60)
-    date_font = ImageFont.truetype(OTHER_FONT, 28)
-    cert_id_font = ImageFont.truetype(OTHER_FONT, 32)
-
-    d = ImageDraw.Draw(TEMPLATE)
-
-    name = name.upper()
-    w, h = d.textsize(name, font=name_font)
-    d.text(((WIDTH - w) / 2, HEIGHT / 2 - 120), name, fill=NAME_COLOR, font=name_font)
-
-    co2_amount += " KGS CO2"
-    w, h = d.textsize(co2_amount, font=co2_amount_font)
-    d.text(
-        ((WIDTH - w) / 2, HEIGHT / 2 + 90),
-        co2_amount,
-        fill=CO2_AMOUNT_COLOR,
-        font=co2_amount_font,
-    )
+TEMPLATE = my_path + r"/../assets/cert_template.png"
+MAIN_FONT = my_path + r"/../assets/font/Alegreya.ttf"
+OTHER_FONT = my_path + r"/../assets/font/OpenSans.ttf"
+NAME_COLOR = "#C8931D"
+CO2_AMOUNT_COLOR = "#C8931D"
+DATE_COLOR = "#6F4C00"
+CERT_ID_COLOR = "#6F4C00"
 
-    d.text(
-        (WIDTH / 2 - 840, HEIGHT / 2 - 560),
-        date,
-        fill=DATE_COLOR,
-        font=date_font,
-    )
+CERT_RENDER_WORKERS = int(os.getenv("CERT_RENDER_WORKERS", "2"))
+CERT_PNG_COMPRESS_LEVEL = int(os.getenv("CERT_PNG_COMPRESS_LEVEL", "6"))
+
+# Rasterized text runs that repeat across certificates (CO2 amounts, dates,
+# the cert id prefix). Names and ids are unique and certificates are cached,
+# so those are drawn without the cache. An amount mask is about 30 KB.
+CERT_TEXT_CACHE_SIZE = int(os.getenv("CERT_TEXT_CACHE_SIZE", "256"))
+CERT_ID_PREFIX = "RCC"
+
+
+@lru_cache(maxsize=None)
+def load_font(font_path: str, size: int):
+    return ImageFont.truetype(font_path, size)
+
+
+def measure_text(text: str, font_path: str, size: int):
+    return load_font(font_path, size).getsize(text)[0]
+
+
+text_width = lru_cache(maxsize=CERT_TEXT_CACHE_SIZE)(measure_text)
 
-    d.text(
-        (WIDTH / 2 - 640, HEIGHT / 2 + 440),
-        cert_id,
-        fill=CERT_ID_COLOR,
-        font=cert_id_font,
+
+class TextLayer:
+    # Anti-aliased coverage mask of one text run, rasterized at the same
+    # subpixel offset ImageDraw.text would use so pasting it with the colour
+    # gives exactly the pixels drawing the text directly would.
+    def __init__(self, text: str, font_path: str, size: int, color: str, subpixel):
+        font = load_font(font_path, size)
+        left, top, right, bottom = font.getbbox(text)
+        # glyphs may overhang the origin (e.g. the left side bearing of "A")
+        self.offset = (min(left, 0), min(top, 0))
+        self.color = color
+        self.mask = Image.new(
+            "L", (right - self.offset[0] + 1, bottom - self.offset[1] + 1)
+        )
+        ImageDraw.Draw(self.mask).text(
+            (subpixel[0] - self.offset[0], subpixel[1] - self.offset[1]),
+            text,
+            fill=255,
+            font=font,
+        )
+
+
+@lru_cache(maxsize=CERT_TEXT_CACHE_SIZE)
+def text_layer(text: str, font_path: str, size: int, color: str, subpixel=(0, 0)):
+    return TextLayer(text, font_path, size, color, subpixel)
+
+
+def draw_text(
+    image, xy, text: str, font_path: str, size: int, color: str, cache: bool = True
+):
+    x, y = xy
+    left, top = math.floor(x), math.floor(y)
+    make_layer = text_layer if cache else TextLayer
+    layer = make_layer(text, font_path, size, color, (x - left, y - top))
+    image.paste(
+        layer.color, (left + layer.offset[0], top + layer.offset[1]), layer.mask
     )
 
-    buffer = BytesIO()
-    TEMPLATE.save(buffer, format="PNG")
-    buffer.seek(0)
 
-    base64_encoded_image = base64.b64encode(buffer.getvalue()).decode()
+class CertificateRenderer:
+    # template and fonts are decoded once, every render draws on a copy
+    def __init__(self, compress_level: int = CERT_PNG_COMPRESS_LEVEL):
+        with Image.open(TEMPLATE) as template:
+            template.load()
+            self.template = template.copy()
+        self.width, self.height = self.template.size
+        self.compress_level = compress_level
+
+        for font_path, size in ((MAIN_FONT, 100), (MAIN_FONT, 60)):
+            load_font(font_path, size)
+        for font_path, size in ((OTHER_FONT, 28), (OTHER_FONT, 32)):
+            load_font(font_path, size)
+
+    def render(self, name: str, co2_amount: str, date: str, cert_id: str):
+        WIDTH, HEIGHT = self.width, self.height
+
+        image = self.template.copy()
+
+        name = name.upper()
+        w = measure_text(name, MAIN_FONT, 100)
+        draw_text(
+            image,
+            ((WIDTH - w) / 2, HEIGHT / 2 - 120),
+            name,
+            MAIN_FONT,
+            100,
+            NAME_COLOR,
+            cache=False,
+        )
+
+        co2_amount += " KGS CO2"
+        w = text_width(co2_amount, MAIN_FONT, 60)
+        draw_text(
+            image,
+            ((WIDTH - w) / 2, HEIGHT / 2 + 90),
+            co2_amount,
+            MAIN_FONT,
+            60,
+            CO2_AMOUNT_COLOR,
+        )
 
-    return base64_encoded_image
+        draw_text(
+            image,
+            (WIDTH / 2 - 840, HEIGHT / 2 - 560),
+            date,
+            OTHER_FONT,
+            28,
+            DATE_COLOR,
+        )
+
+        # the prefix is the same on every certificate, the number is not
+        x, y = WIDTH / 2 - 640, HEIGHT / 2 + 440
+        if cert_id.startswith(CERT_ID_PREFIX):
+            draw_text(image, (x, y), CERT_ID_PREFIX, OTHER_FONT, 32, CERT_ID_COLOR)
+            x += load_font(OTHER_FONT, 32).getlength(CERT_ID_PREFIX)
+            cert_id = cert_id[len(CERT_ID_PREFIX) :]
+        draw_text(image, (x, y), cert_id, OTHER_FONT, 32, CERT_ID_COLOR, cache=False)
+
+        buffer = BytesIO()
+        image.save(buffer, format="PNG", compress_level=self.compress_level)
+
+        return buffer.getvalue()
+
+
+# one renderer per process, created on first use (or by the pool initializer)
+_renderer = None
+
+
+def get_renderer():
+    global _renderer
+    if _renderer is None:
+        _renderer = CertificateRenderer()
+    return _renderer
+
+
+def make_certificate(name: str, co2_amount: str, date: str, cert_id: str):
+    return get_renderer().render(name, co2_amount, date, cert_id)
+
+
+# Pillow work runs in a bounded pool of worker processes so it neither holds
+# the GIL of the api process nor ties up the threadpool serving sync routes.
+_render_pool = None
+
+
+def start_render_pool():
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=CERT_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=get_renderer,
+        )
+    return _render_pool
+
+
+def shutdown_render_pool():
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown()
+        _render_pool = None
+
+
+async def render_certificate(name: str, co2_amount: str, date: str, cert_id: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        start_render_pool(), make_certificate, name, co2_amount, date, cert_id
+    )
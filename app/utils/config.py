@@ -0,0 +1,9 @@
+import os
+
+
+def env_flag(name: str, default: bool = False):
+    # on/off setting from the environment, "1" or "true" in any case is on
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true")
@@ -0,0 +1,80 @@
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import inspect
+
+from datetime import date, datetime
+from functools import lru_cache
+import json
+import os
+
+from ..db.database import Base
+from .config import env_flag
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used without it
+    orjson = None
+
+# list endpoints skip the response_model validation and encode the rows
+# straight from their columns
+FAST_JSON = env_flag("FAST_JSON")
+
+
+def json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    # same separators as JSONResponse
+    return json.dumps(content, default=json_default, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def plan(schema):
+    # (field, nested schema or None) for every field of the response schema
+    fields = []
+    for name, field in schema.__fields__.items():
+        nested = field.type_
+        if not (isinstance(nested, type) and issubclass(nested, BaseModel)):
+            nested = None
+        fields.append((name, nested))
+    return tuple(fields)
+
+
+def columns(obj):
+    # a mapped object in an untyped list field, as jsonable_encoder renders it
+    mapper = inspect(obj).mapper
+    return {attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs}
+
+
+def value(field, nested):
+    if field is None:
+        return None
+    if nested is not None:
+        if isinstance(field, list):
+            return [dump(item, nested) for item in field]
+        return dump(field, nested)
+    if isinstance(field, list):
+        return [columns(item) if isinstance(item, Base) else item for item in field]
+    return field
+
+
+def dump(obj, schema) -> dict:
+    # the schema's fields read off an ORM object (or a dict) without validating
+    # them, for rows that come from our own tables
+    if isinstance(obj, dict):
+        return {name: value(obj.get(name), nested) for name, nested in plan(schema)}
+    return {name: value(getattr(obj, name), nested) for name, nested in plan(schema)}
+
+
+def dump_rows(rows, schema) -> list:
+    return [dump(row, schema) for row in rows]
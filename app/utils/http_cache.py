@@ -0,0 +1,14 @@
+def etag_matches(if_none_match: str, etag: str):
+    # If-None-Match uses the weak comparison function (RFC 7232 section 3.2)
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
@@ -0,0 +1,24 @@
+import os
+
+# names and urls of stored images and their thumbnails, kept apart from the
+# upload pipeline in images.py so the models can use them without its imports
+IMAGE_URL = "/imgs"
+IMAGE_THUMB_WIDTHS = tuple(
+    int(width) for width in os.getenv("IMAGE_THUMB_WIDTHS", "320,640").split(",")
+)
+
+
+def thumbnail_name(image: str, width: int, extension: str):
+    return f"thumbs/{os.path.splitext(image)[0]}_{width}.{extension}"
+
+
+def thumbnails(image: str):
+    # urls of the resized copies of a stored image, smallest first
+    return [
+        {
+            "width": width,
+            "webp": f"{IMAGE_URL}/{thumbnail_name(image, width, 'webp')}",
+            "jpeg": f"{IMAGE_URL}/{thumbnail_name(image, width, 'jpg')}",
+        }
+        for width in IMAGE_THUMB_WIDTHS
+    ]
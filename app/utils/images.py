@@ -0,0 +1,244 @@
+from PIL import Image, ImageOps, UnidentifiedImageError
+from concurrent.futures import ProcessPoolExecutor
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+import aiofiles
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+
+from .config import env_flag
+from .image_urls import IMAGE_THUMB_WIDTHS, thumbnail_name
+from .storage import make_storage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = os.getenv("IMAGE_DIR", "app/imgs")
+# uploads are received here before they are stored
+IMAGE_UPLOAD_DIR = os.getenv("IMAGE_UPLOAD_DIR", IMAGE_DIR)
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_THUMB_QUALITY = int(os.getenv("IMAGE_THUMB_QUALITY", "80"))
+IMAGE_THUMB_WORKERS = int(os.getenv("IMAGE_THUMB_WORKERS", "1"))
+# also keep a full size WebP of every upload, served to clients accepting it
+IMAGE_WEBP_FULL = env_flag("IMAGE_WEBP_FULL")
+
+UPLOAD_CONTENT_TYPES = (b"image/jpeg", b"image/jpg")
+JPEG_MAGIC = b"\xff\xd8\xff"
+# multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+# thumbnail extension -> Pillow format
+THUMB_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+# content-hashed names never change content
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+storage = make_storage("imgs", IMAGE_DIR)
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class FilePart:
+    # collects the bytes of one file field from the multipart parser
+    # callbacks, they are written out after each received chunk
+    def __init__(self, field: str):
+        self.field = field.encode()
+        self.header_field = b""
+        self.header_value = b""
+        self.headers = {}
+        self.receiving = False
+        self.found = False
+        self.pending = []
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition"))
+        self.receiving = options.get(b"name") == self.field and not self.found
+        if self.receiving:
+            self.found = True
+            content_type, _ = parse_options_header(self.headers.get(b"content-type"))
+            if content_type not in UPLOAD_CONTENT_TYPES:
+                raise InvalidImage("Invalid file type, only jpeg accept")
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.receiving:
+            self.pending.append(data[start:end])
+
+    def on_part_end(self):
+        self.receiving = False
+
+    def take(self):
+        pending, self.pending = self.pending, []
+        return pending
+
+
+async def receive_upload(request, field: str):
+    # Streams the file field of a multipart upload to a local temporary file
+    # while it is still being received. Returns the file and the sha256 of
+    # its content.
+    length = request.headers.get("content-length")
+    if length is not None and int(length) > IMAGE_MAX_BYTES + MULTIPART_OVERHEAD:
+        raise ImageTooLarge(f"Images are limited to {IMAGE_MAX_BYTES} bytes")
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise InvalidImage("Expected a multipart/form-data upload")
+
+    part = FilePart(field)
+    parser = MultipartParser(options[b"boundary"], part.callbacks())
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(IMAGE_UPLOAD_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=IMAGE_UPLOAD_DIR, suffix=".part")
+    os.close(fd)
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            async for chunk in request.stream():
+                try:
+                    parser.write(chunk)
+                except MultipartParseError:
+                    raise InvalidImage("Malformed multipart upload")
+                for data in part.take():
+                    if size == 0 and not data.startswith(JPEG_MAGIC[: len(data)]):
+                        raise InvalidImage("Invalid file type, only jpeg accept")
+                    size += len(data)
+                    if size > IMAGE_MAX_BYTES:
+                        raise ImageTooLarge(
+                            f"Images are limited to {IMAGE_MAX_BYTES} bytes"
+                        )
+                    digest.update(data)
+                    await out.write(data)
+            parser.finalize()
+        if not part.found or size == 0:
+            raise InvalidImage(f"Missing {field}")
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest()
+
+
+async def save_image(request, field: str = "file"):
+    # Stores an uploaded jpeg once under the sha256 of its content, after its
+    # thumbnails, so a stored image always has them. Returns its name.
+    tmp_path, digest = await receive_upload(request, field)
+    name = digest + ".jpg"
+    try:
+        if not await run_in_threadpool(storage.exists, name):
+            await generate_thumbnails(name, tmp_path)
+            await run_in_threadpool(
+                storage.put_file, name, tmp_path, cache_control=IMMUTABLE
+            )
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return name
+
+
+def variant_keys(image: str):
+    # (width, extension) -> storage key of every resized copy, width None is
+    # the full size WebP
+    keys = {
+        (width, extension): thumbnail_name(image, width, extension)
+        for width in IMAGE_THUMB_WIDTHS
+        for extension in THUMB_FORMATS
+    }
+    if IMAGE_WEBP_FULL:
+        keys[None, "webp"] = os.path.splitext(image)[0] + ".webp"
+    return keys
+
+
+def make_thumbnails(image: str, source: str = None):
+    # every variant of an image, read from a local file (a new upload) or
+    # from the storage
+    if source is None:
+        source = io.BytesIO(storage.read(image))
+    try:
+        with Image.open(source) as original:
+            original = ImageOps.exif_transpose(original).convert("RGB")
+    except (UnidentifiedImageError, OSError):
+        raise InvalidImage("The image could not be decoded")
+
+    for (width, extension), key in variant_keys(image).items():
+        resized = original
+        if width is not None and original.width > width:
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(
+            buffer, THUMB_FORMATS[extension], quality=IMAGE_THUMB_QUALITY, optimize=True
+        )
+        storage.write(key, buffer.getvalue(), cache_control=IMMUTABLE)
+
+
+# resizing runs in worker processes, like the certificate rendering
+_thumbnail_pool = None
+
+
+def start_thumbnail_pool():
+    global _thumbnail_pool
+    if _thumbnail_pool is None:
+        _thumbnail_pool = ProcessPoolExecutor(
+            max_workers=IMAGE_THUMB_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _thumbnail_pool
+
+
+def shutdown_thumbnail_pool():
+    global _thumbnail_pool
+    if _thumbnail_pool is not None:
+        _thumbnail_pool.shutdown()
+        _thumbnail_pool = None
+
+
+async def generate_thumbnails(image: str, source: str = None):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(start_thumbnail_pool(), make_thumbnails, image, source)
+
+
+def log_failure(future):
+    if future.exception() is not None:
+        logger.warning("thumbnail backfill failed: %s", future.exception())
+
+
+def backfill_thumbnails():
+    # queues the images stored before thumbnails existed, without waiting
+    originals = storage.list()
+    stored = set(originals) | set(storage.list("thumbs"))
+    for name in originals:
+        variants = set(variant_keys(name).values())
+        if name.lower().endswith((".jpg", ".jpeg")) and not variants <= stored:
+            start_thumbnail_pool().submit(make_thumbnails, name).add_done_callback(
+                log_failure
+            )
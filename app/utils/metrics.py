@@ -0,0 +1,207 @@
+from contextvars import ContextVar
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))  # 0 disables the log
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger("app.slow_requests")
+
+
+class RequestStats:
+    def __init__(self, keep_statements: bool):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.sql = [] if keep_statements else None
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+_current = ContextVar("request_stats", default=None)
+_routes = {}  # (method, route, status) -> RouteMetrics
+_lock = threading.Lock()
+
+# callables returning extra exposition lines (e.g. db pool gauges)
+collectors = []
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats.statements += 1
+    stats.db_seconds += elapsed
+    if cursor.description is not None and cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+    if stats.sql is not None:
+        stats.sql.append((elapsed, statement))
+
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+POOL_METRICS = (
+    ("db_pool_size", "size", "gauge"),
+    ("db_pool_checked_out", "checked_out", "gauge"),
+    ("db_pool_checked_in", "checked_in", "gauge"),
+    ("db_pool_overflow", "overflow", "gauge"),
+    ("db_pool_checkouts_total", "checkouts", "counter"),
+    ("db_pool_timeouts_total", "timeouts", "counter"),
+    ("db_pool_wait_seconds_total", "wait_seconds", "counter"),
+)
+
+_pools = {}  # engine label -> (engine, pool_stats)
+
+
+def collect_pools():
+    stats = {name: pool_stats(engine) for name, (engine, pool_stats) in _pools.items()}
+    lines = []
+    for metric, key, kind in POOL_METRICS:
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, values in stats.items():
+            lines.append(f'{metric}{{engine="{name}"}} {values[key]}')
+    return lines
+
+
+def instrument_pool(engine, pool_stats, name: str = "sync"):
+    if not _pools:
+        collectors.append(collect_pools)
+    _pools[name] = (engine, pool_stats)
+
+
+def route_path(scope):
+    # label requests by route template so /boards/1 and /boards/2 share one
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return "unmatched"
+    for route in app.routes:
+        if getattr(route, "endpoint", None) is endpoint or (
+            getattr(route, "app", None) is endpoint
+        ):
+            return route.path
+    return "unmatched"
+
+
+def observe(method: str, route: str, status: int, seconds: float, stats):
+    with _lock:
+        metrics = _routes.get((method, route, status))
+        if metrics is None:
+            metrics = _routes[(method, route, status)] = RouteMetrics()
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                metrics.buckets[i] += 1
+        metrics.count += 1
+        metrics.seconds += seconds
+        metrics.statements += stats.statements
+        metrics.db_seconds += stats.db_seconds
+        metrics.rows += stats.rows
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(keep_statements=SLOW_REQUEST_MS > 0)
+        token = _current.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            route = route_path(scope)
+            observe(scope["method"], route, status, elapsed, stats)
+            if SLOW_REQUEST_MS > 0 and elapsed * 1000 >= SLOW_REQUEST_MS:
+                logger.warning(
+                    "slow request %s %s (%s) %.1f ms, %d statements, %.1f ms in db\n%s",
+                    scope["method"],
+                    scope["path"],
+                    route,
+                    elapsed * 1000,
+                    stats.statements,
+                    stats.db_seconds * 1000,
+                    "\n".join(
+                        f"  {s * 1000:.1f} ms  {' '.join(sql.split())}"
+                        for s, sql in stats.sql
+                    ),
+                )
+
+
+def _labels(method: str, route: str, status: int, **extra):
+    labels = {"method": method, "route": route, "status": str(status), **extra}
+    return ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels.items()
+    )
+
+
+def render():
+    # Prometheus text exposition format 0.0.4
+    with _lock:
+        routes = [
+            (key, dict(vars(m), buckets=list(m.buckets))) for key, m in _routes.items()
+        ]
+
+    lines = [
+        "# HELP http_request_duration_seconds Request latency by route.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route, status), m in routes:
+        for bound, count in zip(LATENCY_BUCKETS, m["buckets"]):
+            labels = _labels(method, route, status, le=str(bound))
+            lines.append(f"http_request_duration_seconds_bucket{{{labels}}} {count}")
+        labels = _labels(method, route, status, le="+Inf")
+        lines.append(f"http_request_duration_seconds_bucket{{{labels}}} {m['count']}")
+        labels = _labels(method, route, status)
+        lines.append(f"http_request_duration_seconds_sum{{{labels}}} {m['seconds']}")
+        lines.append(f"http_request_duration_seconds_count{{{labels}}} {m['count']}")
+
+    for name, key, help_text in (
+        ("http_request_db_statements_total", "statements", "SQL statements sent."),
+        ("http_request_db_seconds_total", "db_seconds", "Time spent in the db."),
+        ("http_request_db_rows_total", "rows", "Rows returned by the db."),
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for (method, route, status), m in routes:
+            lines.append(f"{name}{{{_labels(method, route, status)}}} {m[key]}")
+
+    for collect in collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
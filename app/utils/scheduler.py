@@ -0,0 +1,24 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_stop = threading.Event()
+
+
+def run_every(seconds: float, job, name: str = None):
+    # run job on a daemon thread every `seconds` until stop() is called
+    def loop():
+        while not _stop.wait(seconds):
+            try:
+                job()
+            except Exception:
+                logger.exception("periodic job %s failed", name or job.__name__)
+
+    thread = threading.Thread(target=loop, name=name or job.__name__, daemon=True)
+    thread.start()
+    return thread
+
+
+def stop():
+    _stop.set()
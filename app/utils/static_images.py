@@ -0,0 +1,199 @@
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+from collections import OrderedDict
+from email.utils import formatdate
+import hashlib
+import os
+import posixpath
+import re
+import threading
+
+from .config import env_flag
+from .http_cache import etag_matches
+from .images import IMMUTABLE, storage
+from .storage import CONTENT_TYPES, STORAGE_URL_EXPIRES, clean_key
+
+# cache lifetime of the files whose names are not content hashes
+IMAGE_CACHE_MAX_AGE = int(os.getenv("IMAGE_CACHE_MAX_AGE", "3600"))
+# serve a .webp next to a requested .jpg to clients that accept it
+IMAGE_SERVE_WEBP = env_flag("IMAGE_SERVE_WEBP", True)
+# files (or ranges) up to this size are sent as one body, larger streamed
+IMAGE_READ_CHUNK = int(os.getenv("IMAGE_READ_CHUNK", str(256 * 1024)))
+IMAGE_ETAG_CACHE_ITEMS = int(os.getenv("IMAGE_ETAG_CACHE_ITEMS", "4096"))
+# with a storage that has urls (s3), larger files are redirected to a
+# presigned url instead of passing through the api
+IMAGE_REDIRECT_BYTES = int(os.getenv("IMAGE_REDIRECT_BYTES", str(1024 * 1024)))
+
+# <sha256>.jpg uploads, their thumbnails and variants never change content
+HASHED_NAME = re.compile(r"^([0-9a-f]{64})(_\d+)?\.[a-z]+$")
+RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+_digests = OrderedDict()  # (key, mtime, size) -> sha256
+_digests_lock = threading.Lock()
+
+
+class UnsatisfiableRange(Exception):
+    pass
+
+
+def accepts_webp(accept: str):
+    for media_range in accept.split(","):
+        media_type, _, params = media_range.partition(";")
+        if media_type.strip().lower() != "image/webp":
+            continue
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def content_etag(key: str, stored):
+    # uploads are named by the sha256 of their content, the storage's own
+    # etag (s3) is used for the rest or they are hashed once per change
+    match = HASHED_NAME.match(posixpath.basename(key))
+    if match and match.group(2) is None and key.endswith(".jpg"):
+        return f'"{match.group(1)}"'
+    if stored.etag is not None:
+        return stored.etag
+    cache_key = (key, stored.mtime, stored.size)
+    with _digests_lock:
+        digest = _digests.get(cache_key)
+        if digest is not None:
+            _digests.move_to_end(cache_key)
+            return f'"{digest}"'
+    sha256 = hashlib.sha256()
+    for chunk in storage.iter_range(key, 0, stored.size):
+        sha256.update(chunk)
+    digest = sha256.hexdigest()
+    with _digests_lock:
+        _digests[cache_key] = digest
+        while len(_digests) > IMAGE_ETAG_CACHE_ITEMS:
+            _digests.popitem(last=False)
+    return f'"{digest}"'
+
+
+def parse_range(header: str, size: int):
+    # (first, last) byte of a single range, None to send the whole file for
+    # anything else (multiple or malformed ranges)
+    match = RANGE.fullmatch(header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        if int(last) == 0:
+            raise UnsatisfiableRange()
+        return max(0, size - int(last)), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size:
+        raise UnsatisfiableRange()
+    if first > last:
+        return None
+    return first, last
+
+
+def image_response(name: str, method: str, request_headers):
+    # Conditional and range aware response for a stored image. The ETag is
+    # strong (a content hash), so it is also valid for If-Range.
+    key = clean_key(name)
+    if key is None or posixpath.splitext(key)[1].lower() not in CONTENT_TYPES:
+        return JSONResponse(status_code=404, content={"detail": "Image not found"})
+    stored = storage.stat(key)
+    negotiated = IMAGE_SERVE_WEBP and key.lower().endswith((".jpg", ".jpeg"))
+    if stored is not None and negotiated:
+        if accepts_webp(request_headers.get("accept", "")):
+            webp = posixpath.splitext(key)[0] + ".webp"
+            webp_stored = storage.stat(webp)
+            if webp_stored is not None:
+                key, stored = webp, webp_stored
+    if stored is None:
+        return JSONResponse(status_code=404, content={"detail": "Image not found"})
+
+    etag = content_etag(key, stored)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stored.mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": (
+            IMMUTABLE
+            if HASHED_NAME.match(posixpath.basename(key))
+            else f"public, max-age={IMAGE_CACHE_MAX_AGE}"
+        ),
+    }
+    if negotiated:
+        headers["Vary"] = "Accept"
+    if etag_matches(request_headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    url = storage.url(key) if stored.size > IMAGE_REDIRECT_BYTES else None
+    if url is not None:
+        # the bucket answers ranges and conditional requests itself
+        redirect_headers = {
+            "Location": url,
+            "Cache-Control": f"private, max-age={STORAGE_URL_EXPIRES // 2}",
+        }
+        if negotiated:
+            redirect_headers["Vary"] = "Accept"
+        return Response(status_code=307, headers=redirect_headers)
+
+    size = stored.size
+    status_code, first, last = 200, 0, size - 1
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except UnsatisfiableRange:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            status_code, (first, last) = 206, byte_range
+            headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+
+    length = last - first + 1
+    media_type = CONTENT_TYPES[posixpath.splitext(key)[1].lower()]
+    headers["Content-Length"] = str(length)
+    if method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    if length <= IMAGE_READ_CHUNK:
+        return Response(
+            b"".join(storage.iter_range(key, first, length)),
+            status_code=status_code,
+            headers=headers,
+            media_type=media_type,
+        )
+    return StreamingResponse(
+        storage.iter_range(key, first, length),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
+
+
+class ImageFiles:
+    # ASGI app mounted at /imgs in place of StaticFiles, cheaper than a
+    # FastAPI route for the many small requests of a news feed
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405)
+        else:
+            response = await run_in_threadpool(
+                image_response,
+                scope["path"].lstrip("/"),
+                scope["method"],
+                Headers(scope=scope),
+            )
+        await response(scope, receive, send)
@@ -0,0 +1,248 @@
+from collections import namedtuple
+import os
+import posixpath
+import shutil
+import tempfile
+import threading
+from stat import S_ISREG
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # only needed with STORAGE_BACKEND=s3
+    boto3 = None
+
+# local: files under each store's directory, s3: one bucket (AWS or an S3
+# compatible server such as MinIO), each store under its own key prefix
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_S3_BUCKET = os.getenv("STORAGE_S3_BUCKET")
+STORAGE_S3_ENDPOINT_URL = os.getenv("STORAGE_S3_ENDPOINT_URL") or None
+STORAGE_S3_REGION = os.getenv("STORAGE_S3_REGION") or None
+STORAGE_URL_EXPIRES = int(os.getenv("STORAGE_URL_EXPIRES", "3600"))  # seconds
+STORAGE_READ_CHUNK = 256 * 1024
+
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".png": "image/png",
+}
+
+# etag is None when the backend has none and the caller hashes the content
+StoredObject = namedtuple("StoredObject", ["size", "mtime", "etag"])
+
+
+def content_type(key: str):
+    return CONTENT_TYPES.get(
+        posixpath.splitext(key)[1].lower(), "application/octet-stream"
+    )
+
+
+def clean_key(key: str):
+    # a relative key without "." or ".." parts, None when it would leave the
+    # store
+    key = posixpath.normpath(key.lstrip("/"))
+    if key in (".", "") or key.startswith("../") or key == "..":
+        return None
+    return key
+
+
+class LocalStorage:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, key: str):
+        return os.path.join(self.directory, *key.split("/"))
+
+    def stat(self, key: str):
+        try:
+            stat_result = os.stat(self.path(key))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if not S_ISREG(stat_result.st_mode):
+            return None
+        return StoredObject(stat_result.st_size, stat_result.st_mtime, None)
+
+    def exists(self, key: str):
+        return os.path.isfile(self.path(key))
+
+    def read(self, key: str):
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def iter_range(self, key: str, first: int, length: int):
+        with open(self.path(key), "rb") as f:
+            f.seek(first)
+            while length > 0:
+                chunk = f.read(min(STORAGE_READ_CHUNK, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+
+    def write(self, key: str, data: bytes, cache_control: str = None):
+        # written to a temporary file and renamed, readers never see a
+        # partial file
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def put_file(self, key: str, source: str, cache_control: str = None):
+        # moves a local file into the store
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(source, path)
+        except OSError:  # on another filesystem
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            os.close(fd)
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, path)
+            os.unlink(source)
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, directory: str = ""):
+        # keys of the files directly under a directory ("" for the top)
+        path = self.path(directory) if directory else self.directory
+        if not os.path.isdir(path):
+            return []
+        return [
+            posixpath.join(directory, name)
+            for name in os.listdir(path)
+            if os.path.isfile(os.path.join(path, name))
+        ]
+
+    def url(self, key: str, filename: str = None):
+        # no url of its own, the api serves the bytes
+        return None
+
+
+class S3Storage:
+    def __init__(self, bucket: str, prefix: str):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # created on first use, boto3 clients are safe to share between threads
+        with self._lock:
+            if self._client is None:
+                self._client = boto3.client(
+                    "s3",
+                    endpoint_url=STORAGE_S3_ENDPOINT_URL,
+                    region_name=STORAGE_S3_REGION,
+                )
+            return self._client
+
+    def stat(self, key: str):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return StoredObject(
+            head["ContentLength"], head["LastModified"].timestamp(), head["ETag"]
+        )
+
+    def exists(self, key: str):
+        return self.stat(key) is not None
+
+    def read(self, key: str):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return response["Body"].read()
+
+    def iter_range(self, key: str, first: int, length: int):
+        if length <= 0:  # no valid Range header for zero bytes
+            return
+        response = self.client.get_object(
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Range=f"bytes={first}-{first + length - 1}",
+        )
+        yield from response["Body"].iter_chunks(STORAGE_READ_CHUNK)
+
+    def extra_args(self, key: str, cache_control: str):
+        extra_args = {"ContentType": content_type(key)}
+        if cache_control:
+            extra_args["CacheControl"] = cache_control
+        return extra_args
+
+    def write(self, key: str, data: bytes, cache_control: str = None):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=data,
+            **self.extra_args(key, cache_control),
+        )
+
+    def put_file(self, key: str, source: str, cache_control: str = None):
+        # streamed from disk, in parts for large files; the file is removed
+        self.client.upload_file(
+            source,
+            self.bucket,
+            self.prefix + key,
+            ExtraArgs=self.extra_args(key, cache_control),
+        )
+        os.unlink(source)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def list(self, directory: str = ""):
+        keys = []
+        prefix = self.prefix + (directory + "/" if directory else "")
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=self.bucket, Prefix=prefix, Delimiter="/"
+        ):
+            keys.extend(
+                item["Key"][len(self.prefix) :] for item in page.get("Contents", ())
+            )
+        return keys
+
+    def url(self, key: str, filename: str = None):
+        # presigned, so clients fetch large objects from the bucket directly;
+        # with a filename the bucket sends it as a download of that name
+        params = {"Bucket": self.bucket, "Key": self.prefix + key}
+        if filename:
+            params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=STORAGE_URL_EXPIRES
+        )
+
+
+def make_storage(name: str, directory: str):
+    # the store for one kind of file: the directory with the local backend,
+    # the "<name>/" prefix of the bucket with s3
+    if STORAGE_BACKEND == "s3":
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 installed")
+        if not STORAGE_S3_BUCKET:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs STORAGE_S3_BUCKET")
+        return S3Storage(STORAGE_S3_BUCKET, name + "/")
+    if STORAGE_BACKEND != "local":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND}")
+    return LocalStorage(directory)
@@ -0,0 +1,45 @@
+from fastapi.responses import StreamingResponse
+
+import os
+
+from .fast_json import dumps
+
+STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", "65536"))
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+def chunked(parts):
+    # joins the encoded parts into chunks of about STREAM_CHUNK_BYTES
+    chunk, size = [], 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= STREAM_CHUNK_BYTES:
+            yield b"".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield dumps(row) + b"\n"
+
+
+def iter_json_array(rows):
+    yield b"["
+    separator = b""
+    for row in rows:
+        yield separator + dumps(row)
+        separator = b","
+    yield b"]"
+
+
+def stream_response(rows, format: str, background=None):
+    # rows (dicts) as NDJSON lines or as one JSON array, encoded while the
+    # rows are read
+    parts = iter_ndjson(rows) if format == "ndjson" else iter_json_array(rows)
+    return StreamingResponse(
+        chunked(parts), media_type=MEDIA_TYPES[format], background=background
+    )
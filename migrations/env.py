@@ -0,0 +1,40 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.db import models
+from app.db.database import engine
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# the models are what autogenerate compares the database against
+target_metadata = models.Base.metadata
+
+
+def run_migrations_offline():
+    # `alembic upgrade head --sql` prints the SQL instead of running it
+    context.configure(
+        url=engine.url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    # same DATABASE_URL and connection settings as the app
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,345 @@
+"""baseline
+
+The schema as create_all built it before migrations were added. Databases
+created that way already have most of these tables, so only missing tables
+are created and the user types are only inserted when they are missing.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:31:39.800143
+
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set()
+    if not context.is_offline_mode():
+        existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    def create_table(name, *columns):
+        if name not in existing:
+            op.create_table(name, *columns)
+
+    create_table(
+        "carbon_totals",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("carbon_offset", sa.Float(), nullable=False),
+        sa.Column("donate_amount", sa.Float(), nullable=False),
+        sa.Column("fee", sa.Float(), nullable=False),
+        sa.Column("donation_count", sa.Integer(), nullable=False),
+        sa.Column(
+            "updated_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    create_table(
+        "events",
+        sa.Column("event_id", sa.Integer(), nullable=False),
+        sa.Column("event_type", sa.String(), nullable=True),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("location", sa.String(), nullable=True),
+        sa.Column("start_date", sa.DateTime(), nullable=True),
+        sa.Column("end_date", sa.DateTime(), nullable=True),
+        sa.Column("image", sa.String(), nullable=True),
+        sa.Column("price", sa.Integer(), nullable=True),
+        sa.Column("capacity", sa.Integer(), nullable=True),
+        sa.Column("availability", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("event_id"),
+    )
+    create_table(
+        "facilities",
+        sa.Column("facility_id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("facility_id"),
+    )
+    create_table(
+        "hotels",
+        sa.Column("hotel_id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("stars", sa.Integer(), nullable=True),
+        sa.Column("rating", sa.Integer(), nullable=True),
+        sa.Column("address", sa.String(), nullable=True),
+        sa.Column("city", sa.String(), nullable=True),
+        sa.Column("country", sa.String(), nullable=True),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("hotel_id"),
+    )
+    create_table(
+        "user_types",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_user_types_id", "user_types", ["id"], unique=False, if_not_exists=True
+    )
+    create_table(
+        "event_revenue_daily",
+        sa.Column("event_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("revenue", sa.Integer(), nullable=False),
+        sa.Column("tickets", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["event_id"],
+            ["events.event_id"],
+        ),
+        sa.PrimaryKeyConstraint("event_id", "day"),
+    )
+    create_table(
+        "hotel_facilities",
+        sa.Column("hotel_id", sa.Integer(), nullable=False),
+        sa.Column("facility_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["facility_id"],
+            ["facilities.facility_id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["hotel_id"],
+            ["hotels.hotel_id"],
+        ),
+        sa.PrimaryKeyConstraint("hotel_id", "facility_id"),
+    )
+    create_table(
+        "hotel_revenue_daily",
+        sa.Column("hotel_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("revenue", sa.Integer(), nullable=False),
+        sa.Column("room_nights", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["hotel_id"],
+            ["hotels.hotel_id"],
+        ),
+        sa.PrimaryKeyConstraint("hotel_id", "day"),
+    )
+    create_table(
+        "rooms",
+        sa.Column("room_id", sa.Integer(), nullable=False),
+        sa.Column("hotel_id", sa.Integer(), nullable=True),
+        sa.Column("room_type", sa.String(), nullable=True),
+        sa.Column("price_per_night", sa.Integer(), nullable=True),
+        sa.Column("availability", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["hotel_id"],
+            ["hotels.hotel_id"],
+        ),
+        sa.PrimaryKeyConstraint("room_id"),
+    )
+    create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("email", sa.String(), nullable=True),
+        sa.Column("hashed_password", sa.String(), nullable=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("lastname", sa.String(), nullable=False),
+        sa.Column("mobile_phone", sa.String(), nullable=False),
+        sa.Column("xp", sa.Integer(), nullable=True),
+        sa.Column("user_type_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["user_type_id"],
+            ["user_types.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("email"),
+    )
+    op.create_index("ix_users_id", "users", ["id"], unique=False, if_not_exists=True)
+    create_table(
+        "boards",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(), nullable=True),
+        sa.Column("body", sa.String(), nullable=True),
+        sa.Column("owner_id", sa.Integer(), nullable=True),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+        ),
+        sa.ForeignKeyConstraint(
+            ["owner_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_boards_id", "boards", ["id"], unique=False, if_not_exists=True)
+    create_table(
+        "bookings",
+        sa.Column("booking_id", sa.Integer(), nullable=False),
+        sa.Column("room_id", sa.Integer(), nullable=True),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("check_in_date", sa.DateTime(), nullable=True),
+        sa.Column("check_out_date", sa.DateTime(), nullable=True),
+        sa.Column("guest_name", sa.String(), nullable=True),
+        sa.Column("guest_email", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["room_id"],
+            ["rooms.room_id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("booking_id"),
+    )
+    create_table(
+        "event_bookings",
+        sa.Column("booking_id", sa.Integer(), nullable=False),
+        sa.Column("event_id", sa.Integer(), nullable=True),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("guest_name", sa.String(), nullable=True),
+        sa.Column("guest_email", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["event_id"],
+            ["events.event_id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("booking_id"),
+    )
+    create_table(
+        "news",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(), nullable=True),
+        sa.Column("location", sa.String(), nullable=True),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("join_detail", sa.String(), nullable=True),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+        ),
+        sa.Column("owner_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["owner_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_news_id", "news", ["id"], unique=False, if_not_exists=True)
+    create_table(
+        "room_inventory",
+        sa.Column("room_id", sa.Integer(), nullable=False),
+        sa.Column("night", sa.Date(), nullable=False),
+        sa.Column("booked", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["room_id"],
+            ["rooms.room_id"],
+        ),
+        sa.PrimaryKeyConstraint("room_id", "night"),
+    )
+    create_table(
+        "user_carbon",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("carbon_offset", sa.Float(), nullable=True),
+        sa.Column("donate_amount", sa.Float(), nullable=True),
+        sa.Column("fee", sa.Float(), nullable=True),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_user_carbon_id", "user_carbon", ["id"], unique=False, if_not_exists=True
+    )
+    create_table(
+        "discussions",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("body", sa.String(), nullable=True),
+        sa.Column("owner_id", sa.Integer(), nullable=True),
+        sa.Column("board_id", sa.Integer(), nullable=True),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+        ),
+        sa.ForeignKeyConstraint(
+            ["board_id"],
+            ["boards.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["owner_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_discussions_id", "discussions", ["id"], unique=False, if_not_exists=True
+    )
+    create_table(
+        "new_images",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("image", sa.String(), nullable=True),
+        sa.Column("new_id", sa.Integer(), nullable=True),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+        ),
+        sa.ForeignKeyConstraint(
+            ["new_id"],
+            ["news.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_new_images_id", "new_images", ["id"], unique=False, if_not_exists=True
+    )
+    create_table(
+        "discussion_interactions",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("discussion_id", sa.Integer(), nullable=True),
+        sa.Column("interaction_type", sa.String(), nullable=True),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+        ),
+        sa.ForeignKeyConstraint(
+            ["discussion_id"],
+            ["discussions.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_discussion_interactions_id",
+        "discussion_interactions",
+        ["id"],
+        unique=False,
+        if_not_exists=True,
+    )
+    # 0: admin, 1: user
+    op.execute(
+        "INSERT INTO user_types (id, name) VALUES (0, 'admin'), (1, 'user')"
+        " ON CONFLICT (id) DO NOTHING"
+    )
+
+
+def downgrade():
+    op.drop_table("discussion_interactions")
+    op.drop_table("new_images")
+    op.drop_table("discussions")
+    op.drop_table("user_carbon")
+    op.drop_table("room_inventory")
+    op.drop_table("news")
+    op.drop_table("event_bookings")
+    op.drop_table("bookings")
+    op.drop_table("boards")
+    op.drop_table("users")
+    op.drop_table("rooms")
+    op.drop_table("hotel_revenue_daily")
+    op.drop_table("hotel_facilities")
+    op.drop_table("event_revenue_daily")
+    op.drop_table("user_types")
+    op.drop_table("hotels")
+    op.drop_table("facilities")
+    op.drop_table("events")
+    op.drop_table("carbon_totals")
@@ -0,0 +1,67 @@
+"""index hot filter columns
+
+Indexes the foreign keys the api filters and joins on and the
+(created_at, id) page order of the lists, and allows one interaction per
+user and discussion. ix_hotels_city and
+ix_rooms_hotel_id_price already exist on databases whose hotels and rooms
+tables were created after they were added to the models.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:36:02.511420
+
+"""
+
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ("ix_user_carbon_created_at", "user_carbon", ["created_at", "id"]),
+    (
+        "ix_user_carbon_user_id_created_at",
+        "user_carbon",
+        ["user_id", "created_at", "id"],
+    ),
+    ("ix_news_created_at", "news", ["created_at", "id"]),
+    ("ix_new_images_new_id", "new_images", ["new_id"]),
+    ("ix_boards_created_at", "boards", ["created_at", "id"]),
+    ("ix_discussions_board_id", "discussions", ["board_id"]),
+    ("ix_hotels_city", "hotels", ["city"]),
+    ("ix_rooms_hotel_id_price", "rooms", ["hotel_id", "price_per_night"]),
+    ("ix_bookings_room_id", "bookings", ["room_id"]),
+    ("ix_bookings_user_id", "bookings", ["user_id"]),
+    ("ix_event_bookings_event_id", "event_bookings", ["event_id"]),
+    ("ix_event_bookings_user_id", "event_bookings", ["user_id"]),
+)
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+    # keep only the latest interaction of a user with a discussion
+    op.execute(
+        "DELETE FROM discussion_interactions d"
+        " USING discussion_interactions newer"
+        " WHERE newer.discussion_id = d.discussion_id"
+        " AND newer.user_id = d.user_id AND newer.id > d.id"
+    )
+    op.create_unique_constraint(
+        "uq_discussion_interactions_discussion_id_user_id",
+        "discussion_interactions",
+        ["discussion_id", "user_id"],
+    )
+
+
+def downgrade():
+    op.drop_constraint(
+        "uq_discussion_interactions_discussion_id_user_id",
+        "discussion_interactions",
+        type_="unique",
+    )
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table)
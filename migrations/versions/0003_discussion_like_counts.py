@@ -0,0 +1,38 @@
+"""discussion like counts
+
+Like and dislike counters on discussions, counted from the existing
+interactions.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 13:02:47.118265
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for name in ("like_count", "dislike_count"):
+        op.add_column(
+            "discussions",
+            sa.Column(name, sa.Integer(), server_default="0", nullable=False),
+        )
+    op.execute(
+        "UPDATE discussions d SET"
+        " like_count = (SELECT count(*) FROM discussion_interactions i"
+        " WHERE i.discussion_id = d.id AND i.interaction_type = 'like'),"
+        " dislike_count = (SELECT count(*) FROM discussion_interactions i"
+        " WHERE i.discussion_id = d.id AND i.interaction_type = 'dislike')"
+    )
+
+
+def downgrade():
+    op.drop_column("discussions", "dislike_count")
+    op.drop_column("discussions", "like_count")
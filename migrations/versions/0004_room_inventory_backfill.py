@@ -0,0 +1,45 @@
+"""room inventory backfill
+
+Bookings made before rooms were booked per night decremented
+rooms.availability and were never counted in room_inventory. Every such
+booking is added back to availability (it was never released, not even after
+check out) and the nights of the stays not yet over are counted in
+room_inventory. Only runs while room_inventory is empty: bookings made since
+the change are already counted there and never touched availability.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 14:05:12.402913
+
+"""
+
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "UPDATE rooms r SET availability = coalesce(r.availability, 0) + b.rooms"
+        " FROM (SELECT room_id, count(*) AS rooms FROM bookings GROUP BY room_id) b"
+        " WHERE r.room_id = b.room_id"
+        " AND NOT EXISTS (SELECT 1 FROM room_inventory)"
+    )
+    op.execute(
+        "INSERT INTO room_inventory (room_id, night, booked)"
+        " SELECT b.room_id, n.night::date, count(*)"
+        " FROM bookings b, generate_series(b.check_in_date::date,"
+        " b.check_out_date::date - 1, interval '1 day') AS n(night)"
+        " WHERE b.check_out_date::date > current_date"
+        " AND b.room_id IS NOT NULL"
+        " AND NOT EXISTS (SELECT 1 FROM room_inventory)"
+        " GROUP BY b.room_id, n.night::date"
+    )
+
+
+def downgrade():
+    # the counts cannot be told apart from later bookings, nothing to undo
+    pass
@@ -0,0 +1,45 @@
+"""event booking created at
+
+The day a ticket was booked, which the revenue of an event without a start
+date is counted on. Existing tickets get the day of the migration, and the
+revenue of such events is moved onto that day so the summaries agree with a
+rebuild.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 15:21:37.540218
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "event_bookings",
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False
+        ),
+    )
+    op.execute(
+        "DELETE FROM event_revenue_daily r USING events e"
+        " WHERE r.event_id = e.event_id AND e.start_date IS NULL"
+    )
+    op.execute(
+        "INSERT INTO event_revenue_daily (event_id, day, revenue, tickets)"
+        " SELECT e.event_id, b.created_at::date,"
+        " coalesce(e.price, 0) * count(*), count(*)"
+        " FROM events e JOIN event_bookings b ON b.event_id = e.event_id"
+        " WHERE e.start_date IS NULL"
+        " GROUP BY e.event_id, b.created_at::date"
+    )
+
+
+def downgrade():
+    op.drop_column("event_bookings", "created_at")
@@ -0,0 +1,136 @@
+# Latency and throughput of the api with the sync (threadpool) and the async
+# (asyncpg) database path. Starts uvicorn once per mode and drives it with
+# keep-alive clients, run from the repository root against a database that
+# already has some rows:
+#   DATABASE_URL=postgresql://... python -m scripts.bench_async \
+#       --clients 500 --seconds 20 --paths /carbon/all "/news?limit=20"
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(host, port, paths, deadline, latencies, errors, offset):
+    reader = writer = None
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            status = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError):
+            errors.append(path)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+        if status >= 400:
+            errors.append(path)
+        latencies.append(time.perf_counter() - start)
+    if writer is not None:
+        writer.close()
+
+
+async def load(host, port, paths, clients, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            client(host, port, paths, deadline, latencies, errors, i)
+            for i in range(clients)
+        )
+    )
+    return latencies, errors, time.perf_counter() - start
+
+
+async def wait_ready(host, port, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f"GET /carbon/all HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            await read_response(reader)
+            writer.close()
+            return
+        except (OSError, asyncio.IncompleteReadError):
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def run(mode: str, args):
+    env = dict(os.environ, DB_ASYNC="true" if mode == "async" else "false")
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            args.host,
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+            "--backlog",
+            str(args.clients * 2),
+        ],
+        env=env,
+        stderr=None if args.server_log else subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(wait_ready(args.host, args.port))
+        # warm up pools and caches before measuring
+        asyncio.run(load(args.host, args.port, args.paths, args.clients, 2))
+        latencies, errors, elapsed = asyncio.run(
+            load(args.host, args.port, args.paths, args.clients, args.seconds)
+        )
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(
+        f"{mode:<6} {len(latencies) / elapsed:9.1f} req/s"
+        f"   p50 {p50:8.1f} ms   p99 {p99:8.1f} ms   errors {len(errors)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--modes", nargs="+", default=["sync", "async"])
+    parser.add_argument("--server-log", action="store_true")
+    parser.add_argument(
+        "--paths", nargs="+", default=["/carbon/all", "/news?limit=20", "/users/1"]
+    )
+    args = parser.parse_args()
+    print(f"{args.clients} clients, {args.seconds} s, paths {' '.join(args.paths)}")
+    for mode in args.modes:
+        run(mode, args)
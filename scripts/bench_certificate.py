@@ -0,0 +1,44 @@
+# Certificate render throughput, run from the repository root:
+#   python -m scripts.bench_certificate [renders]
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.utils.certificate import CertificateRenderer, get_renderer, make_certificate
+
+FIELDS = ("Somchai Jaidee", "12.5", "01/02/2023", "RCC0000000042")
+
+
+def reload_per_render(n: int):
+    # what make_certificate did before: reopen the template and fonts every call
+    for _ in range(n):
+        CertificateRenderer().render(*FIELDS)
+
+
+def preloaded(n: int):
+    renderer = get_renderer()
+    for _ in range(n):
+        renderer.render(*FIELDS)
+
+
+def pool(n: int, workers: int):
+    with ProcessPoolExecutor(max_workers=workers, initializer=get_renderer) as ex:
+        list(ex.map(make_certificate, *[[f] * workers for f in FIELDS]))  # warm up
+        list(ex.map(make_certificate, *[[f] * n for f in FIELDS]))
+
+
+def timed(label: str, n: int, fn, *args):
+    start = time.perf_counter()
+    fn(n, *args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {n / elapsed:8.2f} renders/s")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print(f"cpus: {os.cpu_count()}")
+    timed("reload template per render", n, reload_per_render)
+    timed("preloaded renderer", n, preloaded)
+    for workers in sorted({1, os.cpu_count()}):
+        timed(f"process pool ({workers} workers)", n, pool, workers)
@@ -0,0 +1,57 @@
+# Per-field text rendering time with the text layer cache cold and warm, run
+# from the repository root:
+#   python -m scripts.bench_certificate_text [iterations]
+import sys
+import time
+
+from PIL import ImageDraw
+
+from app.utils import certificate as cert
+
+renderer = cert.CertificateRenderer()
+WIDTH, HEIGHT = renderer.width, renderer.height
+
+FIELDS = {
+    "name": ("SOMCHAI JAIDEE", cert.MAIN_FONT, 100, cert.NAME_COLOR),
+    "co2_amount": ("12.5 KGS CO2", cert.MAIN_FONT, 60, cert.CO2_AMOUNT_COLOR),
+    "date": ("01/02/2023", cert.OTHER_FONT, 28, cert.DATE_COLOR),
+    "cert_id": ("RCC0000000042", cert.OTHER_FONT, 32, cert.CERT_ID_COLOR),
+}
+
+
+def direct(image, text, font_path, size, color):
+    d = ImageDraw.Draw(image)
+    font = cert.load_font(font_path, size)
+    w, h = d.textsize(text, font=font)
+    d.text(((WIDTH - w) / 2, HEIGHT / 2), text, fill=color, font=font)
+
+
+def layered(image, text, font_path, size, color):
+    w = cert.text_width(text, font_path, size)
+    cert.draw_text(image, ((WIDTH - w) / 2, HEIGHT / 2), text, font_path, size, color)
+
+
+def cold(image, *field):
+    cert.text_width.cache_clear()
+    cert.text_layer.cache_clear()
+    layered(image, *field)
+
+
+def per_call_ms(fn, field, n):
+    image = renderer.template.copy()
+    start = time.perf_counter()
+    for _ in range(n):
+        fn(image, *field)
+    return (time.perf_counter() - start) / n * 1000
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"{'field':<12} {'ImageDraw':>10} {'cold':>10} {'warm':>10}  (ms/field)")
+    for label, field in FIELDS.items():
+        layered(renderer.template.copy(), *field)
+        print(
+            f"{label:<12} {per_call_ms(direct, field, n):10.3f}"
+            f" {per_call_ms(cold, field, n):10.3f}"
+            f" {per_call_ms(layered, field, n):10.3f}"
+        )
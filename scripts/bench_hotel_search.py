@@ -0,0 +1,124 @@
+# Latency of the hotel availability search over a generated catalogue with
+# partly booked nights. Seeds data, so point DATABASE_URL at a throwaway
+# database migrated with `alembic upgrade head`:
+#   DATABASE_URL=postgresql://... python -m scripts.bench_hotel_search \
+#       --hotels 5000 --cities 50 --searches 200
+import argparse
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from app import crud
+from app.db import models
+from app.db.database import SessionLocal
+
+ROOM_TYPES = ("single", "double", "twin", "suite")
+NIGHTS = 90
+
+
+def seed(db, hotels: int, cities: int, booked: float):
+    db.execute(
+        text(
+            "INSERT INTO hotels (name, stars, rating, address, city, country,"
+            " description)"
+            " SELECT 'Hotel ' || i, 1 + i % 5, 1 + i % 10, 'Street ' || i,"
+            " 'City ' || (i % :cities), 'Country', 'Generated'"
+            " FROM generate_series(1, :hotels) i"
+        ),
+        {"hotels": hotels, "cities": cities},
+    )
+    db.execute(
+        text(
+            "INSERT INTO rooms (hotel_id, room_type, price_per_night, availability)"
+            " SELECT h.hotel_id, t.room_type, 500 + (random() * 5000)::int,"
+            " 1 + (random() * 5)::int"
+            " FROM hotels h CROSS JOIN unnest(CAST(:types AS text[])) t(room_type)"
+        ),
+        {"types": list(ROOM_TYPES)},
+    )
+    # a share of the nights is partly booked, some of them fully
+    db.execute(
+        text(
+            "INSERT INTO room_inventory (room_id, night, booked)"
+            " SELECT r.room_id, n::date,"
+            " LEAST(r.availability, 1 + (random() * r.availability)::int)"
+            " FROM rooms r CROSS JOIN generate_series("
+            "   CAST(:start AS date), CAST(:end AS date), interval '1 day') n"
+            " WHERE random() < :booked"
+        ),
+        {
+            "start": date.today(),
+            "end": date.today() + timedelta(days=NIGHTS - 1),
+            "booked": booked,
+        },
+    )
+    db.commit()
+    db.execute(text("ANALYZE hotels; ANALYZE rooms; ANALYZE room_inventory"))
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hotels", type=int, default=5000)
+    parser.add_argument("--cities", type=int, default=50)
+    parser.add_argument("--booked", type=float, default=0.3)
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--explain", action="store_true")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    start = time.perf_counter()
+    seed(db, args.hotels, args.cities, args.booked)
+    print(
+        f"seeded {args.hotels} hotels, {args.hotels * len(ROOM_TYPES)} rooms,"
+        f" {NIGHTS} nights in {time.perf_counter() - start:.1f} s"
+    )
+
+    timings = []
+    results = []
+    for _ in range(args.searches):
+        check_in = date.today() + timedelta(days=random.randrange(NIGHTS - 7))
+        check_out = check_in + timedelta(days=random.randint(1, 7))
+        start = time.perf_counter()
+        hotels, _ = crud.search_hotels(
+            db,
+            city=f"City {random.randrange(args.cities)}",
+            check_in=check_in,
+            check_out=check_out,
+            max_price=4000,
+        )
+        timings.append(time.perf_counter() - start)
+        results.append(len(hotels))
+        db.rollback()
+
+    timings.sort()
+    print(
+        f"{args.searches} searches: p50 {statistics.median(timings) * 1000:.1f} ms"
+        f"   p99 {timings[int(len(timings) * 0.99) - 1] * 1000:.1f} ms"
+        f"   mean hotels/page {statistics.mean(results):.1f}"
+    )
+
+    if args.explain:
+        check_in = date.today() + timedelta(days=10)
+        query = (
+            db.query(models.Room)
+            .join(models.Hotel)
+            .filter(
+                models.Hotel.city == "City 1",
+                crud.room_free(check_in, check_in + timedelta(days=3)),
+            )
+        )
+        compiled = query.statement.compile(dialect=db.bind.dialect)
+        plan = db.connection().exec_driver_sql(
+            "EXPLAIN ANALYZE " + str(compiled), compiled.params
+        )
+        for (line,) in plan:
+            print(line)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
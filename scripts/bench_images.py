@@ -0,0 +1,154 @@
+# Requests per second for hot images (already in the page cache) served by the
+# StaticFiles mount /imgs was before and by the current /imgs app: full
+# responses, WebP negotiation, 304 revalidations and byte ranges. Writes an
+# upload and its thumbnails to a temporary IMAGE_DIR. The api still needs
+# DATABASE_URL pointing at a database migrated with `alembic upgrade head`:
+#   DATABASE_URL=postgresql://... python -m scripts.bench_images \
+#       --clients 50 --seconds 10
+import argparse
+import asyncio
+import hashlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+
+from app.utils import images
+from app.utils.storage import LocalStorage
+from scripts.bench_async import wait_ready
+
+
+def static_app():
+    # the api with /imgs mounted as it was
+    from app.main import app
+
+    mount = Mount("/imgs", StaticFiles(directory=images.IMAGE_DIR), name="imgs")
+    app.router.routes.insert(0, mount)
+    return app
+
+
+def seed(directory: str, size: int):
+    # a noisy photo sized like a phone upload, and its thumbnails
+    images.storage = LocalStorage(directory)
+    buffer = io.BytesIO()
+    Image.effect_noise((size, size * 3 // 4), 40).convert("RGB").save(
+        buffer, "JPEG", quality=85
+    )
+    name = hashlib.sha256(buffer.getvalue()).hexdigest() + ".jpg"
+    with open(os.path.join(directory, name), "wb") as f:
+        f.write(buffer.getvalue())
+    images.make_thumbnails(name)
+    thumbnail = images.thumbnail_name(name, images.IMAGE_THUMB_WIDTHS[0], "jpg")
+    return name, thumbnail, len(buffer.getvalue())
+
+
+async def request(reader, writer, host: str, path: str, headers: str):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n{headers}\r\n".encode())
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    response_headers = {}
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        response_headers[name.strip().lower().decode()] = value.strip().decode()
+    await reader.readexactly(int(response_headers.get("content-length", 0)))
+    return status, response_headers
+
+
+async def client(host, port, path, headers, deadline, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    while time.perf_counter() < deadline:
+        status, _ = await request(reader, writer, host, path, headers)
+        statuses.append(status)
+    writer.close()
+
+
+async def load(host, port, path, headers, clients, seconds):
+    statuses = []
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(client(host, port, path, headers, deadline, statuses) for _ in range(clients))
+    )
+    return statuses, time.perf_counter() - start
+
+
+async def etag(host, port, path, headers=""):
+    reader, writer = await asyncio.open_connection(host, port)
+    _, response_headers = await request(reader, writer, host, path, headers)
+    writer.close()
+    return response_headers["etag"]
+
+
+def run(server: str, app: list, cases, args, env):
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            *app,
+            "--host",
+            args.host,
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        env=env,
+        stderr=None if args.server_log else subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(wait_ready(args.host, args.port))
+        for case, path, headers in cases:
+            if headers == "revalidate":
+                current = asyncio.run(etag(args.host, args.port, path))
+                headers = f"If-None-Match: {current}\r\n"
+            asyncio.run(load(args.host, args.port, path, headers, args.clients, 1))
+            statuses, elapsed = asyncio.run(
+                load(args.host, args.port, path, headers, args.clients, args.seconds)
+            )
+            print(
+                f"{server:<7} {case:<20} {len(statuses) / elapsed:9.1f} req/s"
+                f"   status {sorted(set(statuses))}"
+            )
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--width", type=int, default=1600)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--server-log", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        name, thumbnail, size = seed(directory, args.width)
+        env = dict(os.environ, IMAGE_DIR=directory)
+        cases = [
+            ("thumbnail", f"/imgs/{thumbnail}", ""),
+            ("thumbnail webp", f"/imgs/{thumbnail}", "Accept: image/webp\r\n"),
+            ("thumbnail 304", f"/imgs/{thumbnail}", "revalidate"),
+            (f"original {size // 1024} KiB", f"/imgs/{name}", ""),
+            ("original 304", f"/imgs/{name}", "revalidate"),
+            ("original range 64k", f"/imgs/{name}", "Range: bytes=0-65535\r\n"),
+        ]
+        print(f"{args.clients} clients, {args.seconds} s per case")
+        run(
+            "static", ["--factory", "scripts.bench_images:static_app"], cases, args, env
+        )
+        run("imgs", ["app.main:app"], cases, args, env)
+
+
+if __name__ == "__main__":
+    main()
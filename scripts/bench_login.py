@@ -0,0 +1,133 @@
+# Login throughput per bcrypt cost, and the latency of another route while
+# logins saturate the bcrypt threads. Stores a user with a hash of each cost,
+# then starts uvicorn once per cost (BCRYPT_ROUNDS) and drives /login with
+# keep-alive clients, run from the repository root against a database
+# migrated with `alembic upgrade head`:
+#   DATABASE_URL=postgresql://... JWT_SECRET=... python -m scripts.bench_login \
+#       --rounds 12 10 --clients 20 --seconds 10
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+from passlib.context import CryptContext
+
+from app.db import models
+from app.db.database import SessionLocal
+from scripts.bench_async import read_response, wait_ready
+
+EMAIL = "bench-login@example.com"
+PASSWORD = "bench-login-password"
+
+
+def seed(rounds: int):
+    hashed_password = CryptContext(schemes=["bcrypt"]).hash(PASSWORD, rounds=rounds)
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == EMAIL).first()
+        if user is None:
+            user = models.User(
+                email=EMAIL,
+                name="Bench",
+                lastname="Login",
+                mobile_phone="0800000000",
+                user_type_id=1,
+            )
+            db.add(user)
+        user.hashed_password = hashed_password
+        db.commit()
+    finally:
+        db.close()
+
+
+async def client(host, port, request, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        writer.write(request)
+        status = await read_response(reader)
+        if status >= 400:
+            errors.append(status)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def load(host, port, clients, probe, seconds):
+    login = (
+        f"POST /login?{urlencode({'email': EMAIL, 'password': PASSWORD})} HTTP/1.1"
+        f"\r\nHost: {host}\r\nContent-Length: 0\r\n\r\n"
+    ).encode()
+    other = f"GET {probe} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+    logins, others, errors = [], [], []
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(client(host, port, login, deadline, logins, errors) for _ in range(clients)),
+        client(host, port, other, deadline, others, errors),
+    )
+    return logins, others, errors, time.perf_counter() - start
+
+
+def percentile(latencies, fraction):
+    latencies = sorted(latencies)
+    return latencies[max(0, int(len(latencies) * fraction) - 1)] * 1000
+
+
+def run(rounds: int, args):
+    seed(rounds)
+    env = dict(os.environ, BCRYPT_ROUNDS=str(rounds))
+    if args.workers is not None:
+        env["BCRYPT_WORKERS"] = str(args.workers)
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            args.host,
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        env=env,
+        stderr=None if args.server_log else subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(wait_ready(args.host, args.port))
+        asyncio.run(load(args.host, args.port, args.clients, args.probe, 1))
+        logins, others, errors, elapsed = asyncio.run(
+            load(args.host, args.port, args.clients, args.probe, args.seconds)
+        )
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(
+        f"rounds {rounds:<3} {len(logins) / elapsed:8.1f} logins/s"
+        f"   login p50 {statistics.median(logins) * 1000:7.1f} ms"
+        f"   {args.probe} p50 {statistics.median(others) * 1000:6.1f} ms"
+        f" p99 {percentile(others, 0.99):6.1f} ms   errors {len(errors)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, nargs="+", default=[12, 10])
+    parser.add_argument("--workers", type=int, help="BCRYPT_WORKERS")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--probe", default="/carbon/all")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--server-log", action="store_true")
+    args = parser.parse_args()
+    print(f"{args.clients} login clients and one {args.probe} client, {args.seconds} s")
+    for rounds in args.rounds:
+        run(rounds, args)
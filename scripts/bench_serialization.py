@@ -0,0 +1,199 @@
+# Time to turn 10k rows of every list response schema into a response body,
+# the FastAPI way (response_model validation, jsonable_encoder, json) against
+# the FAST_JSON path (plain column dicts encoded with orjson when installed).
+# The rows are built in memory and nothing is queried, but importing the
+# models still needs a DATABASE_URL:
+#   DATABASE_URL=postgresql://... python -m scripts.bench_serialization --repeat 5
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.db import models, schemas
+from app.utils import fast_json
+
+NOW = datetime(2024, 1, 1, 12, 30, 15, 123456)
+
+
+def loaded(obj, **relationships):
+    # relationships set as if selectinload had loaded them, without backrefs
+    for name, items in relationships.items():
+        set_committed_value(obj, name, items)
+    return obj
+
+
+def carbon(i):
+    return models.UserCarbon(
+        id=i,
+        user_id=1 + i % 100,
+        carbon_offset=i * 0.25,
+        donate_amount=i * 1.5,
+        fee=0.5,
+        created_at=NOW - timedelta(minutes=i),
+    )
+
+
+def image(i):
+    return models.NewImage(
+        id=i, new_id=i // 2, image=f"{i}.jpg", created_at=NOW - timedelta(minutes=i)
+    )
+
+
+def discussion(i):
+    return models.Discussion(
+        id=i,
+        body=f"Discussion {i} body",
+        owner_id=1 + i % 100,
+        board_id=i // 3,
+        like_count=i % 7,
+        dislike_count=i % 3,
+        created_at=NOW - timedelta(minutes=i),
+    )
+
+
+def room(i):
+    return models.Room(
+        room_id=i,
+        hotel_id=1 + i % 100,
+        room_type="double",
+        price_per_night=500 + i % 5000,
+        availability=1 + i % 5,
+    )
+
+
+ROWS = {
+    schemas.User: lambda i: loaded(
+        models.User(
+            id=i,
+            email=f"user{i}@example.com",
+            hashed_password="-",
+            name="Name",
+            lastname="Lastname",
+            mobile_phone="0800000000",
+            user_type_id=1,
+            xp=i % 1000,
+        ),
+        user_carbon=[carbon(i * 2), carbon(i * 2 + 1)],
+    ),
+    schemas.UserCarbon: carbon,
+    schemas.New: lambda i: loaded(
+        models.New(
+            id=i,
+            title=f"News {i}",
+            location="Bangkok",
+            description="A description of the news " * 4,
+            join_detail="Join at the front desk",
+            owner_id=1 + i % 100,
+            created_at=NOW - timedelta(minutes=i),
+        ),
+        images=[image(i * 2), image(i * 2 + 1)],
+    ),
+    schemas.NewImage: image,
+    schemas.Board: lambda i: loaded(
+        models.Board(
+            id=i,
+            title=f"Board {i}",
+            body="A board body " * 4,
+            owner_id=1 + i % 100,
+            created_at=NOW - timedelta(minutes=i),
+        ),
+        discussions=[discussion(i * 3 + n) for n in range(3)],
+    ),
+    schemas.Discussion: discussion,
+    schemas.Hotel: lambda i: loaded(
+        models.Hotel(
+            hotel_id=i,
+            name=f"Hotel {i}",
+            stars=1 + i % 5,
+            rating=1 + i % 10,
+            address=f"Street {i}",
+            city=f"City {i % 50}",
+            country="Thailand",
+            description="A hotel description " * 4,
+        ),
+        facilities=[
+            models.Facility(facility_id=n, name=f"Facility {n}") for n in range(3)
+        ],
+    ),
+    schemas.Room: room,
+    schemas.Booking: lambda i: models.Booking(
+        booking_id=i,
+        room_id=1 + i % 100,
+        user_id=1 + i % 100,
+        check_in_date=NOW + timedelta(days=i % 30),
+        check_out_date=NOW + timedelta(days=i % 30 + 2),
+        guest_name=f"Guest {i}",
+        guest_email=f"guest{i}@example.com",
+    ),
+    schemas.Event: lambda i: models.Event(
+        event_id=i,
+        event_type="concert",
+        name=f"Event {i}",
+        description="An event description " * 4,
+        location="Bangkok",
+        start_date=NOW + timedelta(days=i % 30),
+        end_date=NOW + timedelta(days=i % 30, hours=3),
+        image=None,
+        price=1000,
+        capacity=100,
+        availability=50,
+    ),
+    schemas.EventBooking: lambda i: models.EventBooking(
+        booking_id=i,
+        event_id=1 + i % 100,
+        user_id=1 + i % 100,
+        guest_name=f"Guest {i}",
+        guest_email=f"guest{i}@example.com",
+    ),
+}
+
+
+def pydantic_body(rows, field):
+    # what a route with response_model=list[schema] does with the rows
+    content = asyncio.run(serialize_response(field=field, response_content=rows))
+    return JSONResponse(content).body
+
+
+def fast_body(rows, schema):
+    return fast_json.FastJSONResponse(fast_json.dump_rows(rows, schema)).body
+
+
+def best(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), body
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    encoder = "orjson" if fast_json.orjson is not None else "json (orjson missing)"
+    print(f"ms per 10k rows, best of {args.repeat}, fast path encoder {encoder}")
+    print(f"{'schema':<14} {'pydantic':>9} {'fast':>9} {'speedup':>8}  same body")
+    for schema, make in ROWS.items():
+        rows = [make(i) for i in range(1, args.rows + 1)]
+        field = create_response_field(name="response", type_=List[schema])
+        before, expected = best(lambda: pydantic_body(rows, field), args.repeat)
+        after, body = best(lambda: fast_body(rows, schema), args.repeat)
+        scale = 10000 / args.rows * 1000
+        print(
+            f"{schema.__name__:<14} {before * scale:9.1f} {after * scale:9.1f}"
+            f" {before / after:7.1f}x  {json.loads(body) == json.loads(expected)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# Peak server memory and time for reading a whole collection as one page
+# versus streaming it as NDJSON or a JSON array. Seeds bookings, then starts
+# uvicorn once per mode so each peak RSS is measured on a fresh process.
+# Point DATABASE_URL at a throwaway database migrated with
+# `alembic upgrade head`:
+#   DATABASE_URL=postgresql://... python -m scripts.bench_streaming --rows 200000
+import argparse
+import asyncio
+import http.client
+import os
+import subprocess
+import sys
+import time
+
+from sqlalchemy import text
+
+from app.db.database import engine
+from scripts.bench_async import wait_ready
+
+
+def seed(rows: int):
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO users (email, name, lastname, mobile_phone)"
+                " VALUES ('bench-streaming@example.com', 'Bench', 'Streaming', '-')"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO hotels (name, city, country)"
+                " VALUES ('Bench Hotel', 'Bangkok', 'Thailand')"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO rooms (hotel_id, room_type, price_per_night, availability)"
+                " SELECT max(hotel_id), 'double', 1000, 1 FROM hotels"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO bookings (room_id, user_id, check_in_date,"
+                " check_out_date, guest_name, guest_email)"
+                " SELECT (SELECT max(room_id) FROM rooms),"
+                " (SELECT max(id) FROM users), now(), now() + interval '1 day',"
+                " 'Guest ' || i, 'guest' || i || '@example.com'"
+                " FROM generate_series(1, :rows) i"
+            ),
+            {"rows": rows},
+        )
+
+
+def peak_rss_mb(pid: int):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+
+def run(mode: str, path: str, args):
+    env = dict(os.environ, PAGE_SIZE_MAX=str(args.rows))
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            args.host,
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+        stderr=None if args.server_log else subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(wait_ready(args.host, args.port))
+        idle = peak_rss_mb(server.pid)
+        start = time.perf_counter()
+        first_byte = None
+        size = 0
+        connection = http.client.HTTPConnection(args.host, args.port, timeout=600)
+        connection.request("GET", path)
+        response = connection.getresponse()
+        while True:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            size += len(chunk)
+        elapsed = time.perf_counter() - start
+        peak = peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    print(
+        f"{mode:<7} {response.status} {size / 1e6:8.1f} MB"
+        f"   first byte {first_byte * 1000:7.0f} ms   total {elapsed:6.2f} s"
+        f"   server peak RSS {peak:6.0f} MB (+{peak - idle:.0f} MB)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--server-log", action="store_true")
+    args = parser.parse_args()
+
+    seed(args.rows)
+    print(f"/bookings with {args.rows} rows")
+    run("page", f"/bookings?limit={args.rows}", args)
+    run("ndjson", "/bookings?stream=ndjson", args)
+    run("json", "/bookings?stream=json", args)
@@ -0,0 +1,105 @@
+# Fails when a read endpoint sends more SQL statements than its budget, e.g.
+# because a relationship serialized by its response schema is lazy loaded per
+# row. Seeds data, so point DATABASE_URL at a throwaway database migrated with
+# `alembic upgrade head`:
+#   DATABASE_URL=postgresql://... python -m scripts.check_query_budgets
+import sys
+
+from fastapi.testclient import TestClient
+
+from app.db import models
+from app.db.database import SessionLocal, engine
+from app.main import app
+from app.utils.query_counter import count_queries
+
+ROWS = 5
+
+# path -> maximum statements per request, independent of ROWS
+QUERY_BUDGETS = {
+    "/users/{user_id}": 2,
+    "/carbon?user_id={user_id}": 1,
+    "/news": 2,
+    "/boards": 2,
+    "/boards/{board_id}": 2,
+    "/boards/{board_id}/discussions": 1,
+    "/hotels": 5,
+    "/bookings": 1,
+    "/events": 1,
+    "/getAllEventBookings": 1,
+}
+
+
+def seed():
+    db = SessionLocal()
+    user = models.User(
+        email="query-budget@example.com",
+        hashed_password="-",
+        name="Query",
+        lastname="Budget",
+        mobile_phone="-",
+    )
+    db.add(user)
+    db.flush()
+    for i in range(ROWS):
+        db.add(
+            models.UserCarbon(user_id=user.id, carbon_offset=1, donate_amount=1, fee=0)
+        )
+        new = models.New(
+            title="t", location="l", description="d", join_detail="j", owner_id=user.id
+        )
+        new.images = [models.NewImage(image="img.jpg") for _ in range(2)]
+        db.add(new)
+        board = models.Board(title="t", body="b", owner_id=user.id)
+        for _ in range(3):
+            discussion = models.Discussion(body="b", owner_id=user.id)
+            discussion.details = [
+                models.DiscussionInteraction(user_id=user.id, interaction_type="like")
+            ]
+            board.discussions.append(discussion)
+        db.add(board)
+        hotel = models.Hotel(
+            name="h",
+            stars=3,
+            rating=8,
+            address="a",
+            city="c",
+            country="c",
+            description="d",
+        )
+        hotel.facilities = [models.Facility(name="f") for _ in range(2)]
+        db.add(hotel)
+        db.flush()
+        db.add_all(
+            models.Room(
+                hotel_id=hotel.hotel_id,
+                room_type="r",
+                price_per_night=100 * j,
+                availability=1,
+            )
+            for j in range(1, 3)
+        )
+    db.commit()
+    ids = {"user_id": user.id, "board_id": board.id}
+    db.close()
+    return ids
+
+
+def main():
+    ids = seed()
+    client = TestClient(app)
+    failed = False
+    for path, budget in QUERY_BUDGETS.items():
+        url = path.format(**ids)
+        with count_queries(engine) as counter:
+            response = client.get(url)
+        ok = response.status_code == 200 and counter.count <= budget
+        failed = failed or not ok
+        print(
+            f"{'ok' if ok else 'FAIL':<5} {url:<36} {response.status_code}"
+            f" {counter.count:>3} / {budget} queries"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+# Fails when a hot query reads one of its tables with a sequential scan,
+# e.g. because the index on its filter column is missing. Seeds enough rows
+# for the planner to prefer the indexes, so point DATABASE_URL at a throwaway
+# database migrated with `alembic upgrade head`:
+#   DATABASE_URL=postgresql://... python -m scripts.check_query_plans
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from app import crud
+from app.db import models
+from app.db.database import SessionLocal, engine
+from app.utils.query_counter import count_queries
+
+ROWS = 20000
+
+# name -> (crud call, tables every statement of it must read through an index)
+HOT_QUERIES = {
+    "user carbon page": (
+        lambda db: crud.get_user_carbon(db, user_id=7),
+        {"user_carbon"},
+    ),
+    "all carbon page": (
+        lambda db: crud.get_all_carbon_rows(db),
+        {"user_carbon"},
+    ),
+    "news page with images": (lambda db: crud.get_news(db), {"news", "new_images"}),
+    "boards page": (lambda db: crud.get_boards(db), {"boards"}),
+    "board discussions": (
+        lambda db: crud.get_discussions_by_board_id(db, board_id=7),
+        {"discussions"},
+    ),
+    "user bookings": (
+        lambda db: crud.get_bookings_by_user_id(db, user_id=7),
+        {"bookings"},
+    ),
+    "user booked hotels": (
+        lambda db: crud.get_user_booked_hotel(db, user_id=7),
+        {"bookings", "rooms", "hotels"},
+    ),
+    "room info": (
+        lambda db: crud.get_info_by_room_id(db, room_id=7),
+        {"rooms", "bookings"},
+    ),
+    "hotel rooms": (
+        lambda db: crud.get_available_rooms(db, hotel_id=7),
+        {"rooms"},
+    ),
+    "hotel search": (
+        lambda db: crud.search_hotels(
+            db,
+            city="City 7",
+            check_in=date.today() + timedelta(days=7),
+            check_out=date.today() + timedelta(days=9),
+        ),
+        {"hotels", "rooms", "room_inventory"},
+    ),
+    "user booked events": (
+        lambda db: crud.get_user_booked_event(db, user_id=7),
+        {"event_bookings"},
+    ),
+    "event tickets": (
+        lambda db: db.query(models.EventBooking)
+        .filter(models.EventBooking.event_id == 7)
+        .all(),
+        {"event_bookings"},
+    ),
+}
+
+
+SEED = [
+    "INSERT INTO users (email, name, lastname, mobile_phone)"
+    " SELECT 'plan' || i || '@example.com', 'n', 'l', '-'"
+    " FROM generate_series(1, :rows / 10) i",
+    "INSERT INTO user_carbon (user_id, carbon_offset, donate_amount, fee,"
+    " created_at)"
+    " SELECT 1 + i % (:rows / 10), 1, 1, 0, now() - i * interval '1 minute'"
+    " FROM generate_series(1, :rows) i",
+    "INSERT INTO news (title, owner_id) SELECT 't', 1"
+    " FROM generate_series(1, :rows) i",
+    "INSERT INTO new_images (image, new_id) SELECT 'i.jpg', 1 + i % :rows"
+    " FROM generate_series(1, :rows * 2) i",
+    "INSERT INTO boards (title, owner_id) SELECT 't', 1"
+    " FROM generate_series(1, :rows) i",
+    "INSERT INTO discussions (body, owner_id, board_id) SELECT 'b', 1, 1 + i % :rows"
+    " FROM generate_series(1, :rows * 2) i",
+    "INSERT INTO discussion_interactions (user_id, discussion_id, interaction_type)"
+    " SELECT u, d, 'like' FROM generate_series(1, 5) u,"
+    " generate_series(1, :rows) d",
+    "INSERT INTO hotels (name, city, country)"
+    " SELECT 'h', 'City ' || i % 100, 'c' FROM generate_series(1, :rows / 4) i",
+    "INSERT INTO rooms (hotel_id, room_type, price_per_night, availability)"
+    " SELECT 1 + i % (:rows / 4), 'r', i % 5000, 5 FROM generate_series(1, :rows) i",
+    "INSERT INTO room_inventory (room_id, night, booked)"
+    " SELECT 1 + i % :rows, current_date + i / :rows, 1"
+    " FROM generate_series(0, :rows * 5 - 1) i",
+    "INSERT INTO bookings (room_id, user_id, check_in_date, check_out_date)"
+    " SELECT 1 + i % :rows, 1 + i % (:rows / 10), now(), now() + interval '1 day'"
+    " FROM generate_series(1, :rows) i",
+    "INSERT INTO events (name, price, availability) SELECT 'e', 1, 100"
+    " FROM generate_series(1, :rows / 10) i",
+    "INSERT INTO event_bookings (event_id, user_id)"
+    " SELECT 1 + i % (:rows / 10), 1 + i % (:rows / 10)"
+    " FROM generate_series(1, :rows) i",
+]
+
+
+def seed():
+    with engine.begin() as connection:
+        for statement in SEED:
+            connection.execute(text(statement), {"rows": ROWS})
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT").execute(
+            text("ANALYZE")
+        )
+
+
+def scans(plan):
+    # (node type, table) of every node in the plan that reads a table
+    if "Relation Name" in plan:
+        yield plan["Node Type"], plan["Relation Name"]
+    for child in plan.get("Plans", ()):
+        yield from scans(child)
+
+
+def main():
+    seed()
+    failed = False
+    db = SessionLocal()
+    for name, (call, tables) in HOT_QUERIES.items():
+        with count_queries(engine) as counter:
+            call(db)
+        db.rollback()
+
+        seq_scans = set()
+        for statement, parameters in zip(counter.statements, counter.parameters):
+            ((plan,),) = db.connection().exec_driver_sql(
+                "EXPLAIN (FORMAT JSON) " + statement, parameters
+            )
+            seq_scans.update(
+                table
+                for node, table in scans(plan[0]["Plan"])
+                if node == "Seq Scan" and table in tables
+            )
+        db.rollback()
+
+        ok = not seq_scans
+        failed = failed or not ok
+        print(
+            f"{'ok' if ok else 'FAIL':<5} {name:<24} {counter.count} queries"
+            + (f"   seq scan on {', '.join(sorted(seq_scans))}" if seq_scans else "")
+        )
+    db.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# Runs the storage interface (write, read, stat, exists, iter_range, put_file,
+# list, url, delete) against the local backend and the S3 backend, and fails
+# when a backend behaves differently. With --moto the S3 side runs against a
+# moto server started in-process; without it against the bucket configured by
+# the STORAGE_S3_* variables, e.g. a MinIO container. No database is needed:
+#   python -m scripts.check_storage --moto
+#   STORAGE_S3_BUCKET=test STORAGE_S3_ENDPOINT_URL=http://localhost:9000 \
+#       AWS_ACCESS_KEY_ID=... AWS_SECRET_ACCESS_KEY=... \
+#       python -m scripts.check_storage
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import urllib.request
+import uuid
+
+from app.utils import storage
+
+DATA = bytes(range(256)) * 4096  # 1 MiB, above the read chunk size
+
+
+def checks(store, directory: str):
+    # (name, passed) for every behaviour the callers rely on
+    yield "missing stat", store.stat("missing.bin") is None
+    yield "missing read", store.read("missing.bin") is None
+    yield "missing exists", not store.exists("missing.bin")
+
+    store.write("data.bin", DATA, cache_control="public, max-age=60")
+    stored = store.stat("data.bin")
+    yield "write and stat", stored is not None and stored.size == len(DATA)
+    yield "exists", store.exists("data.bin")
+    yield "read", store.read("data.bin") == DATA
+    yield "full range", b"".join(store.iter_range("data.bin", 0, len(DATA))) == DATA
+    yield "middle range", (
+        b"".join(store.iter_range("data.bin", 1000, 70000)) == DATA[1000:71000]
+    )
+    yield "empty range", b"".join(store.iter_range("data.bin", 10, 0)) == b""
+
+    store.write("empty.bin", b"")
+    yield "empty object", (
+        store.stat("empty.bin").size == 0
+        and b"".join(store.iter_range("empty.bin", 0, 0)) == b""
+    )
+
+    fd, source = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        f.write(DATA[:5000])
+    store.put_file("sub/moved.bin", source)
+    yield "put_file", (
+        store.read("sub/moved.bin") == DATA[:5000] and not os.path.exists(source)
+    )
+    yield "list top", sorted(store.list()) == ["data.bin", "empty.bin"]
+    yield "list directory", store.list("sub") == ["sub/moved.bin"]
+
+    url = store.url("data.bin", filename="data.bin")
+    if url is None:
+        yield "no url", isinstance(store, storage.LocalStorage)
+    else:
+        with urllib.request.urlopen(url) as response:
+            body = response.read()
+            disposition = response.headers.get("Content-Disposition", "")
+        yield "presigned url", body == DATA and "data.bin" in disposition
+
+    for key in ("data.bin", "empty.bin", "sub/moved.bin"):
+        store.delete(key)
+    store.delete("missing.bin")
+    yield "delete", not store.list() and not store.exists("sub/moved.bin")
+
+
+def start_moto():
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "check")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "check")
+    storage.STORAGE_S3_ENDPOINT_URL = f"http://{host}:{port}"
+    storage.STORAGE_S3_REGION = storage.STORAGE_S3_REGION or "us-east-1"
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--moto", action="store_true")
+    args = parser.parse_args()
+
+    if storage.boto3 is None:
+        print("boto3 is not installed")
+        return 1
+    server = start_moto() if args.moto else None
+    bucket = storage.STORAGE_S3_BUCKET
+    if args.moto:
+        bucket = "check-storage"
+        storage.S3Storage(bucket, "").client.create_bucket(Bucket=bucket)
+    if not bucket:
+        print("set STORAGE_S3_BUCKET or pass --moto")
+        return 1
+
+    failed = False
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                "local": storage.LocalStorage(os.path.join(directory, "store")),
+                # a fresh prefix, so an existing bucket is left alone
+                "s3": storage.S3Storage(bucket, f"check-{uuid.uuid4().hex}/"),
+            }
+            for name, store in backends.items():
+                for check, ok in checks(store, directory):
+                    failed = failed or not ok
+                    print(f"{'ok' if ok else 'FAIL':<5} {name:<6} {check}")
+    finally:
+        if server is not None:
+            server.stop()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
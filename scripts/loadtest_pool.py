@@ -0,0 +1,60 @@
+# Throughput of concurrent sessions for a range of pool sizes, run from the
+# repository root against a running database:
+#   DATABASE_URL=postgresql://... python -m scripts.loadtest_pool \
+#       --clients 32 --seconds 5 --pool-sizes 1 2 5 10 20
+import argparse
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import make_engine, pool_stats
+
+# a short query with a little server side latency, like a typical request
+QUERY = text("SELECT pg_sleep(:seconds), count(*) FROM users")
+
+
+def run(pool_size: int, clients: int, seconds: float, query_ms: float):
+    engine = make_engine(pool_size=pool_size, max_overflow=0, pool_timeout=60)
+    Session = sessionmaker(bind=engine)
+    done = [0] * clients
+    deadline = time.perf_counter() + seconds
+
+    def client(i):
+        while time.perf_counter() < deadline:
+            db = Session()
+            try:
+                db.execute(QUERY, {"seconds": query_ms / 1000}).all()
+            finally:
+                db.close()
+            done[i] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stats = pool_stats(engine)
+    engine.dispose()
+    total = sum(done)
+    wait_ms = stats["wait_seconds"] / max(stats["checkouts"], 1) * 1000
+    print(
+        f"pool_size={pool_size:<4} {total / elapsed:9.1f} req/s"
+        f"   mean checkout wait {wait_ms:7.2f} ms   timeouts {stats['timeouts']}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--query-ms", type=float, default=5)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 2, 5, 10, 20])
+    args = parser.parse_args()
+    print(f"{args.clients} clients, {args.query_ms} ms queries, {args.seconds} s each")
+    for pool_size in args.pool_sizes:
+        run(pool_size, args.clients, args.seconds, args.query_ms)
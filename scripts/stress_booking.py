@@ -0,0 +1,129 @@
+# Fires many parallel bookings of the same stay at one room type and checks
+# that exactly its availability got booked, the rest were refused as sold out
+# and every night of the stay is counted once per booking, in the inventory
+# and in the hotel revenue. Seeds data, so point DATABASE_URL at a throwaway
+# database migrated with `alembic upgrade head`:
+#   DATABASE_URL=postgresql://... python -m scripts.stress_booking \
+#       --bookings 300 --availability 25 --nights 3 --connections 50
+import argparse
+import sys
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+from app import crud
+from app.db import models, schemas
+from app.db.database import make_engine
+
+PRICE = 1000
+
+
+def seed(Session, availability: int):
+    db = Session()
+    user = models.User(
+        email="stress-booking@example.com",
+        hashed_password="-",
+        name="Stress",
+        lastname="Booking",
+        mobile_phone="-",
+    )
+    hotel = models.Hotel(name="Stress Hotel", city="Bangkok", country="Thailand")
+    db.add_all([user, hotel])
+    db.flush()
+    room = models.Room(
+        hotel_id=hotel.hotel_id,
+        room_type="double",
+        price_per_night=PRICE,
+        availability=availability,
+    )
+    db.add(room)
+    db.commit()
+    ids = (user.id, room.room_id)
+    db.close()
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=300)
+    parser.add_argument("--availability", type=int, default=25)
+    parser.add_argument("--nights", type=int, default=3)
+    parser.add_argument("--connections", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = make_engine(pool_size=args.connections, max_overflow=0, pool_timeout=60)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    user_id, room_id = seed(Session, args.availability)
+
+    check_in = datetime.now() + timedelta(days=7)
+    booking = schemas.BookingCreate(
+        room_id=room_id,
+        check_in_date=check_in,
+        check_out_date=check_in + timedelta(days=args.nights),
+        guest_name="Stress",
+        guest_email="stress-booking@example.com",
+    )
+    results = {"booked": 0, "sold_out": 0, "error": 0}
+    lock = threading.Lock()
+    start = threading.Barrier(args.bookings)
+
+    def book():
+        db = Session()
+        start.wait()
+        try:
+            crud.book_room(db, booking, user_id)
+            result = "booked"
+        except crud.SoldOut:
+            result = "sold_out"
+        except Exception as e:
+            print("error:", e)
+            result = "error"
+        finally:
+            db.close()
+        with lock:
+            results[result] += 1
+
+    threads = [threading.Thread(target=book) for _ in range(args.bookings)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db = Session()
+    nights = [
+        booked
+        for (booked,) in db.query(models.RoomInventory.booked).filter(
+            models.RoomInventory.room_id == room_id
+        )
+    ]
+    revenue = [
+        revenue
+        for (revenue,) in db.query(models.HotelRevenue.revenue)
+        .join(models.Room, models.Room.hotel_id == models.HotelRevenue.hotel_id)
+        .filter(models.Room.room_id == room_id)
+    ]
+    bookings = db.query(models.Booking).filter(models.Booking.room_id == room_id)
+    booked_rows = bookings.count()
+    db.close()
+    engine.dispose()
+
+    print(
+        f"{args.bookings} parallel bookings for {args.availability} rooms:"
+        f" {results['booked']} booked, {results['sold_out']} sold out,"
+        f" {results['error']} errors; {booked_rows} booking rows,"
+        f" booked per night {nights}"
+    )
+    expected = min(args.bookings, args.availability)
+    ok = (
+        results["booked"] == booked_rows == expected
+        and results["error"] == 0
+        and nights == [expected] * args.nights
+        and revenue == [expected * PRICE] * args.nights
+    )
+    print("ok" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())